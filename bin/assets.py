@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+"""
+Put the site's static files (images, stylesheets, scripts, papers,
+etc.) in the output directory.
+
+Each asset is published twice: under its own name (for the thousands
+of pages that refer to images and files by path), and under a name
+that includes a hash of its contents (e.g., 'css/swc.3f9a1c0b2d.css'),
+which templates get through the 'asset' function so that browsers can
+cache those files forever (see the rules in _htaccess).  Files are
+hard-linked into the output directory where possible, cloned (on file
+systems that support reflinks) if not, and only copied as a last
+resort.  Hashes are remembered in the build cache directory and only
+recomputed for files whose modification time or size has changed.
+"""
+
+import os
+import glob
+import fnmatch
+import json
+import shutil
+import hashlib
+import tempfile
+
+#-------------------------------------------------------------------------------
+
+ASSET_PATTERNS = [
+    '3_0/*/*.jpg',
+    '3_0/*/*.JPG',
+    '3_0/*/*.png',
+    '4_0/*/*.odp',
+    '4_0/*/*.pdf',
+    '4_0/*/*/*.mp3',
+    '4_0/*/*/*.png',
+    'badges/*/*.json',
+    'badges/*/*.png',
+    'css/*.css',
+    'css/bootstrap/*.css',
+    'css/bootstrap/img/*.png',
+    'files/*.bib',
+    'files/*/*/*.*',
+    'files/papers/*.pdf',
+    'img/*.ico',
+    'img/*.png',
+    'img/*/*.gif',
+    'img/*/*.jpg',
+    'img/*/*.png',
+    'js/*.js',
+    'js/bootstrap/*.js'
+]
+
+CACHE_FILE = 'assets.json'
+VERSION = 2
+HASH_LENGTH = 10
+
+# Linux ioctl for cloning a file's extents (a 'reflink').
+FICLONE = 0x40049409
+
+#-------------------------------------------------------------------------------
+
+class AssetStage(object):
+    """
+    Find and hash the static files matching 'patterns' when created,
+    so that templates can look up fingerprinted names before anything
+    is published, then link them into the output directory when
+    publish() is called.
+    """
+
+    def __init__(self, output_dir, cache_dir, patterns=ASSET_PATTERNS):
+        self.output_dir = output_dir
+        self.patterns = patterns
+        self.filename = None
+        if cache_dir is not None:
+            self.filename = os.path.join(cache_dir, CACHE_FILE)
+        self.old = {}
+        self.files = {}
+        self.manifest = {}
+        self.digest = None
+        self.published = False
+        self._load()
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                self._add(os.path.normpath(path))
+
+    def url(self, path):
+        """
+        Return the fingerprinted path of an asset (relative to the site
+        root).
+        """
+        key = os.path.normpath(path)
+        assert key in self.manifest, \
+               'Unknown asset %s' % path
+        return self.manifest[key]
+
+    def signature(self):
+        """
+        Return a hash of the manifest, which changes whenever any
+        asset does.  (It is computed once, since every page's signature
+        includes it.)
+        """
+        if self.digest is None:
+            text = json.dumps(sorted(self.manifest.items()))
+            self.digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        return self.digest
+
+    def covers(self, path):
+        """
+        Is this path (relative to the site's root) one that would be
+        published as an asset if it existed?
+        """
+        return any(fnmatch.fnmatch(path, pattern) for pattern in self.patterns)
+
+    def hashes(self):
+        """
+        Return the SHA-1 hashes of the published files (under both of
+        their names), keyed by path relative to the output directory.
+        """
+        result = {}
+        for (path, entry) in self.files.items():
+            result[path] = entry['digest']
+            result[entry['fingerprinted']] = entry['digest']
+        return result
+
+    def publish(self):
+        """
+        Link every asset into the output directory under both of its
+        names, and remove fingerprinted copies left over from earlier
+        versions of assets.  Returns the number of files placed.  This
+        is only done once (a new stage must be created to pick up
+        changes to assets).
+        """
+        if self.published:
+            return 0
+        count = 0
+        for (path, fingerprinted) in sorted(self.manifest.items()):
+            for name in (path, fingerprinted):
+                if place(path, os.path.join(self.output_dir, name)):
+                    count += 1
+        current = set(self.manifest.values())
+        for entry in self.old.values():
+            stale = os.path.join(self.output_dir, entry['fingerprinted'])
+            if (entry['fingerprinted'] not in current) and os.path.isfile(stale):
+                os.unlink(stale)
+        self._save()
+        self.published = True
+        return count
+
+    def _add(self, path):
+        """
+        Hash an asset (unless it hasn't changed since it was last
+        hashed) and record its fingerprinted name.
+        """
+        st = os.stat(path)
+        entry = self.old.get(path)
+        if (entry is None) or (entry['mtime'] != st.st_mtime) or \
+           (entry['size'] != st.st_size):
+            with open(path, 'rb') as reader:
+                digest = hashlib.sha1(reader.read()).hexdigest()
+            entry = {'mtime' : st.st_mtime,
+                     'size' : st.st_size,
+                     'digest' : digest,
+                     'fingerprinted' : fingerprint(path, digest)}
+        self.files[path] = entry
+        self.manifest[path] = entry['fingerprinted']
+
+    def _load(self):
+        """
+        Load the hashes saved by the previous build (if any).
+        """
+        if (self.filename is None) or (not os.path.isfile(self.filename)):
+            return
+        with open(self.filename, 'r') as reader:
+            data = json.load(reader)
+        if data.get('version') == VERSION:
+            self.old = data['files']
+
+    def _save(self):
+        """
+        Save the hashes of this build's assets.
+        """
+        if self.filename is None:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.filename, 'w') as writer:
+            json.dump({'version' : VERSION, 'files' : self.files},
+                      writer, indent=1, sort_keys=True)
+
+#-------------------------------------------------------------------------------
+
+def fingerprint(path, digest):
+    """
+    Insert (part of) a hash before a path's extension.
+    """
+    stem, ext = os.path.splitext(path)
+    return '%s.%s%s' % (stem, digest[:HASH_LENGTH], ext)
+
+def place(src, dst):
+    """
+    Make dst a copy of src (unless it already is one), returning True
+    if anything was done.  A hard link is tried first, then a reflink,
+    then an ordinary copy.  The new file is created beside dst and
+    renamed over it, so dst is never missing or partly written.
+    """
+    if os.path.isfile(dst) and \
+       (os.path.samefile(src, dst) or same_stat(src, dst)):
+        return False
+    directory = os.path.dirname(dst)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(dst))
+    os.close(fd)
+    os.unlink(temp)
+    try:
+        try:
+            os.link(src, temp)
+        except (OSError, AttributeError):
+            if not clone(src, temp):
+                shutil.copy2(src, temp)
+        if hasattr(os, 'replace'):
+            os.replace(temp, dst)
+        else:
+            os.rename(temp, dst)
+    except:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+    return True
+
+def clone(src, dst):
+    """
+    Try to make dst a reflink of src (sharing its storage until either
+    is changed), returning False if the platform or file system can't.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    with open(src, 'rb') as reader:
+        with open(dst, 'wb') as writer:
+            try:
+                fcntl.ioctl(writer.fileno(), FICLONE, reader.fileno())
+                shutil.copystat(src, dst)
+                return True
+            except (IOError, OSError):
+                pass
+    os.unlink(dst)
+    return False
+
+def same_stat(left, right):
+    """
+    Do two files have the same size and modification time?  (Copies
+    and clones keep the original's modification time.)
+    """
+    a, b = os.stat(left), os.stat(right)
+    return (a.st_size == b.st_size) and (a.st_mtime == b.st_mtime)
@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+
+"""
+Benchmark compile.py on synthetic web sites.
+
+For each requested size, this generates a site with the same layout as
+the real one (blog/yyyy/mm/*.html posts with post_id metadata,
+bootcamps/yyyy-mm-site.html pages with dates and venues, and lessons
+made up of topics with keypoints), builds it with compile.py in a
+separate process, and reports pages per second, peak memory, and the
+time spent in each phase of the build (from compile.py's --profile
+output).  Each size is built twice: once from scratch ('cold'), and
+once more with the build cache after changing a single post
+('incremental').
+
+Results are appended to a JSON-lines file (in the build cache
+directory by default), one record per size and mode, labelled with a
+version string (the output of 'git describe' by default).  Each new
+result is compared with the last result for the same size and mode
+from a different version so that regressions show up immediately.
+"""
+
+import sys
+import os
+import getopt
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import datetime
+
+#-------------------------------------------------------------------------------
+
+USAGE = """bench.py [options] [number_of_posts...]: benchmark compile.py
+-h                                      show this help and exit
+-j number_of_jobs                       passed to compile.py
+-k directory_path                       generate sites here and keep them
+-l version_label                        default: output of 'git describe'
+-o results_file_path                    default: .cache/bench-results.jsonl
+"""
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+DEFAULT_RESULTS = os.path.join('.cache', 'bench-results.jsonl')
+
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPILE = os.path.join(BIN_DIR, 'compile.py')
+
+BOOTCAMPS_PER_POST = 0.1
+LESSONS_PER_POST = 0.01
+TOPICS_PER_LESSON = 10
+FIRST_YEAR = 2004
+POSTS_PER_MONTH = 20
+
+AUTHORS = ['author%02d' % i for i in range(40)]
+CATEGORIES = ['category%02d' % i for i in range(20)]
+WORDS = '''software carpentry science research python shell version control
+testing data database make regular expressions program design lesson
+instructor boot camp student learner feedback workshop library
+reproducible'''.split()
+
+SEED = 20130601
+
+#-------------------------------------------------------------------------------
+
+BASE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<!-- pageclass: GenericPage -->
+{% block file_metadata %}{% endblock file_metadata %}
+<head>
+  <title>{{page.title}}</title>
+  <meta http-equiv="last-modified" content="{{timestamp}}" />
+</head>
+<body>
+  <ul>
+    {% if page.prev %}<li><a href="{{page.prev}}">Previous</a></li>{% endif %}
+    <li><a href="{{page.uplink}}">Up</a></li>
+    {% if page.next %}<li><a href="{{page.next}}">Next</a></li>{% endif %}
+  </ul>
+  <h1>{{page.title}}</h1>
+  {% block content %}{% endblock content %}
+  {% include "_footer.html" %}
+</body>
+</html>
+'''
+
+FOOTER_TEMPLATE = '''<p>Built {{today}} for <a href="{{site}}">{{site}}</a>.</p>
+'''
+
+HOME_PAGE = '''{% extends "_base.html" %}
+{% block file_metadata %}
+  <meta name="title" content="Home Page" />
+  <meta name="subfile" content="blog/index.html" />
+  <meta name="subfile" content="bootcamps/index.html" />
+  <meta name="subfile" content="lessons/index.html" />
+{% endblock file_metadata %}
+{% block content %}
+<p>A synthetic site for benchmarking.</p>
+{% endblock content %}
+'''
+
+BLOG_TEMPLATE = '''{% extends "_base.html" %}
+<!-- pageclass: BlogPostPage -->
+{% block content %}
+<p>Posted {{page.post_date}} by {{page.author_id}} in {{page.category|join(', ')}}.</p>
+{{ super() }}
+{% endblock content %}
+'''
+
+BLOG_INDEX = '''{% extends "_base.html" %}
+<!-- pageclass: BlogIndexPage -->
+{% block file_metadata %}
+  <meta name="title" content="Blog" />
+  <meta name="subglob" content="*/*/*.html" />
+{% endblock file_metadata %}
+{% block content %}
+{% for post in page.children[-page.blog_history_length:]|reverse %}
+  <h2><a href="{{post.index_link()}}">{{post.title}}</a></h2>
+  {{post.excerpt(page.filename)|safe}}
+{% endfor %}
+<table>
+{% for year in page.years %}
+  <tr><th>{{year}}</th>
+  {% for month in page.months %}
+    <td>{% for post in page.posts(year, month) %}<a href="{{post.index_link()}}">{{post.post_id}}</a> {% endfor %}</td>
+  {% endfor %}
+  </tr>
+{% endfor %}
+</table>
+{% endblock content %}
+'''
+
+BLOG_ARCHIVE = '''{% extends "_base.html" %}
+{% block content %}
+<table>
+{% for post in page.children %}
+  <tr><td>{{post.post_date}}</td><td><a href="{{site}}/blog/{{post.index_link()}}">{{post.title}}</a></td></tr>
+{% endfor %}
+</table>
+{% if page.count > 1 %}<p>Page {{page.number}} of {{page.count}}.</p>{% endif %}
+{% endblock content %}
+'''
+
+BLOG_POST = '''{%% extends "_blog.html" %%}
+{%% block file_metadata %%}
+<meta name="post_id" content="%(post_id)d" />
+<meta name="author_id" content="%(author_id)s" />
+<meta name="title" content="%(title)s" />
+<meta name="post_date" content="%(post_date)s" />
+%(categories)s
+{%% endblock file_metadata %%}
+{%% block content %%}
+%(content)s
+{%% endblock content %%}
+'''
+
+BOOTCAMP_TEMPLATE = '''{% extends "_base.html" %}
+<!-- pageclass: BootCampPage -->
+{% block content %}
+<p>{{page.venue}}: {{page.date}} ({{page.instructor}})</p>
+{{ super() }}
+{% endblock content %}
+'''
+
+BOOTCAMP_INDEX = '''{% extends "_base.html" %}
+{% block file_metadata %}
+  <meta name="title" content="Boot Camps" />
+  <meta name="subglob" content="*-*-*.html" />
+{% endblock file_metadata %}
+{% block content %}
+<table>
+{% for bootcamp in page.children|reverse %}
+  <tr>
+    <td><a href="{{bootcamp.link()}}">{{bootcamp.venue}}</a></td>
+    <td>{{bootcamp.date}}</td>
+    <td>{% if bootcamp.startdate > today %}upcoming{% else %}past{% endif %}</td>
+  </tr>
+{% endfor %}
+</table>
+{% endblock content %}
+'''
+
+BOOTCAMP_ARCHIVE = '''{% extends "_base.html" %}
+{% block content %}
+<table>
+{% for bootcamp in page.children %}
+  <tr><td><a href="{{root_path}}/bootcamps/{{bootcamp.slug}}.html">{{bootcamp.venue}}</a></td><td>{{bootcamp.date}}</td></tr>
+{% endfor %}
+</table>
+{% if page.count > 1 %}<p>Page {{page.number}} of {{page.count}}.</p>{% endif %}
+{% endblock content %}
+'''
+
+BOOTCAMP = '''{%% extends "_bootcamp.html" %%}
+{%% block file_metadata %%}
+  <meta name="venue" content="%(venue)s" />
+  <meta name="startdate" content="%(startdate)s" />
+  <meta name="enddate" content="%(enddate)s" />
+  <meta name="latlng" content="%(latlng)s" />
+%(instructors)s
+{%% endblock file_metadata %%}
+{%% block content %%}
+%(content)s
+{%% endblock content %%}
+'''
+
+LESSONS_INDEX = '''{%% extends "_base.html" %%}
+{%% block file_metadata %%}
+  <meta name="title" content="Lessons" />
+%(subfiles)s
+{%% endblock file_metadata %%}
+{%% block content %%}
+{%% for lesson in page.children %%}
+  <h2><a href="{{lesson.slug}}/index.html">{{lesson.title}}</a></h2>
+  <ul>{{lesson.keypoints|safe}}</ul>
+{%% endfor %%}
+{%% endblock content %%}
+'''
+
+LESSON_TEMPLATE = '''{% extends "_base.html" %}
+<!-- pageclass: LessonPage -->
+'''
+
+LESSON = '''{%% extends "_lesson.html" %%}
+{%% block file_metadata %%}
+  <meta name="title" content="%(title)s" />
+%(subfiles)s
+{%% endblock file_metadata %%}
+{%% block content %%}
+<ul class="keypoints">
+%(keypoints)s
+</ul>
+{%% for topic in page.children %%}
+  <p><a href="{{topic.link()}}">{{topic.title}}</a></p>
+{%% endfor %%}
+{%% endblock content %%}
+'''
+
+TOPIC_TEMPLATE = '''{% extends "_base.html" %}
+<!-- pageclass: TopicPage -->
+'''
+
+TOPIC = '''{%% extends "_topic.html" %%}
+{%% block file_metadata %%}
+  <meta name="title" content="%(title)s" />
+{%% endblock file_metadata %%}
+{%% block content %%}
+%(content)s
+{%% endblock content %%}
+'''
+
+#-------------------------------------------------------------------------------
+
+class SiteGenerator(object):
+    """
+    Generate a synthetic site with a given number of blog posts (and a
+    proportional number of boot camps and lessons).  The same size
+    always produces the same site.
+    """
+
+    def __init__(self, root_dir, num_posts):
+        self.root_dir = root_dir
+        self.num_posts = num_posts
+        self.random = random.Random(SEED)
+        self.last_post = None
+
+    def __call__(self):
+        self._write('_base.html', BASE_TEMPLATE)
+        self._write('_footer.html', FOOTER_TEMPLATE)
+        self._write('index.html', HOME_PAGE)
+        self._write('metadata.json', json.dumps({
+            'author_id' : dict((a, a.title()) for a in AUTHORS),
+            'category' : dict((c, c.title()) for c in CATEGORIES)
+        }))
+        self._blog()
+        self._bootcamps()
+        self._lessons()
+
+    def _blog(self):
+        self._write('blog/_blog.html', BLOG_TEMPLATE)
+        self._write('blog/index.html', BLOG_INDEX)
+        self._write('blog/_archive.html', BLOG_ARCHIVE)
+        for i in range(self.num_posts):
+            year = FIRST_YEAR + i // (12 * POSTS_PER_MONTH)
+            month = 1 + (i // POSTS_PER_MONTH) % 12
+            day = 1 + i % 28
+            categories = self.random.sample(CATEGORIES, self.random.randint(1, 3))
+            path = 'blog/%04d/%02d/post-%06d.html' % (year, month, i)
+            self._write(path, BLOG_POST % {
+                'post_id' : i + 1,
+                'author_id' : self.random.choice(AUTHORS),
+                'title' : self._sentence(4, 10),
+                'post_date' : '%04d-%02d-%02d' % (year, month, day),
+                'categories' : '\n'.join('<meta name="category" content="%s" />' % c
+                                         for c in categories),
+                'content' : self._paragraphs(3, 12)
+            })
+            self.last_post = path
+
+    def _bootcamps(self):
+        self._write('bootcamps/_bootcamp.html', BOOTCAMP_TEMPLATE)
+        self._write('bootcamps/index.html', BOOTCAMP_INDEX)
+        self._write('bootcamps/_archive.html', BOOTCAMP_ARCHIVE)
+        for i in range(max(1, int(self.num_posts * BOOTCAMPS_PER_POST))):
+            start = datetime.date(FIRST_YEAR, 1, 1) + datetime.timedelta(i * 3)
+            end = start + datetime.timedelta(1)
+            instructors = self.random.sample(AUTHORS, 2)
+            path = 'bootcamps/%04d-%02d-site%d.html' % (start.year, start.month, i)
+            self._write(path, BOOTCAMP % {
+                'venue' : 'Venue %d' % i,
+                'startdate' : start.isoformat(),
+                'enddate' : end.isoformat(),
+                'latlng' : '%.5f,%.5f' % (self.random.uniform(-90, 90),
+                                          self.random.uniform(-180, 180)),
+                'instructors' : '\n'.join('  <meta name="instructor" content="%s" />' % x
+                                          for x in instructors),
+                'content' : self._paragraphs(2, 6)
+            })
+
+    def _lessons(self):
+        self._write('lessons/_lesson.html', LESSON_TEMPLATE)
+        self._write('lessons/_topic.html', TOPIC_TEMPLATE)
+        num_lessons = max(1, int(self.num_posts * LESSONS_PER_POST))
+        lessons = ['lesson%03d' % i for i in range(num_lessons)]
+        self._write('lessons/index.html', LESSONS_INDEX % {
+            'subfiles' : self._subfiles('%s/index.html' % x for x in lessons)
+        })
+        for lesson in lessons:
+            topics = ['topic%02d.html' % i for i in range(TOPICS_PER_LESSON)]
+            self._write('lessons/%s/index.html' % lesson, LESSON % {
+                'title' : self._sentence(2, 5),
+                'subfiles' : self._subfiles(topics),
+                'keypoints' : '\n'.join('<li>%s</li>' % self._sentence(5, 10)
+                                        for i in range(4))
+            })
+            for topic in topics:
+                self._write('lessons/%s/%s' % (lesson, topic), TOPIC % {
+                    'title' : self._sentence(2, 5),
+                    'content' : self._paragraphs(4, 10)
+                })
+
+    def _subfiles(self, names):
+        return '\n'.join('  <meta name="subfile" content="%s" />' % x for x in names)
+
+    def _sentence(self, low, high):
+        words = [self.random.choice(WORDS) for i in range(self.random.randint(low, high))]
+        return ' '.join(words).capitalize()
+
+    def _paragraphs(self, low, high):
+        result = []
+        for i in range(self.random.randint(low, high)):
+            text = '  '.join(self._sentence(6, 20) + '.' for j in range(5))
+            if self.random.random() < 0.3:
+                text += ' See <a href="{{root_path}}/index.html">the home page</a>.'
+            result.append('<p>%s</p>' % text)
+        return '\n'.join(result)
+
+    def _write(self, path, text):
+        path = os.path.join(self.root_dir, path)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as writer:
+            writer.write(text)
+
+#-------------------------------------------------------------------------------
+
+def build(site_dir, jobs, cache_dir):
+    """
+    Build a generated site with compile.py in a child process, returning
+    a dictionary of measurements.
+    """
+    out_dir = os.path.join(site_dir, '_build')
+    profile = os.path.join(site_dir, '_profile.json')
+    args = [sys.executable, COMPILE,
+            '-b', cache_dir,
+            '-d', '2013-06-01',
+            '-j', str(jobs),
+            '-m', 'metadata.json',
+            '-o', out_dir,
+            '-p', '.', '-p', 'blog', '-p', 'bootcamps', '-p', 'lessons',
+            '-r', os.path.join(out_dir, 'feed.xml'),
+            '-c', os.path.join(out_dir, 'bootcamps.ics'),
+            '-s', 'http://example.org',
+            '--profile=%s' % profile,
+            '--reproducible',
+            'index.html']
+
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        child = subprocess.Popen(args, cwd=site_dir, stderr=devnull)
+        pid, status, usage = os.wait4(child.pid, 0)
+    seconds = time.time() - start
+    child.returncode = status  # reaped by wait4, so Popen mustn't wait
+    assert status == 0, \
+           'compile.py failed on %s (status %d)' % (site_dir, status)
+
+    with open(profile, 'r') as reader:
+        events = json.load(reader)['traceEvents']
+    phases = {}
+    for e in events:
+        phases[e['name']] = phases.get(e['name'], 0) + e['dur'] / 1e6
+    pages = len([e for e in events if e['name'] == 'render_template'])
+
+    # ru_maxrss is in kilobytes on Linux but bytes on Mac OS X.
+    peak_rss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+
+    return {'seconds' : round(seconds, 3),
+            'pages' : pages,
+            'pages_per_second' : round(pages / seconds, 1),
+            'peak_rss_kb' : peak_rss,
+            'phases' : dict((k, round(v, 3)) for (k, v) in phases.items())}
+
+#-------------------------------------------------------------------------------
+
+def run(size, keep_dir, jobs, label):
+    """
+    Generate a site of the given size, benchmark a cold build and an
+    incremental rebuild, and return the two result records.
+    """
+    if keep_dir is None:
+        site_dir = tempfile.mkdtemp(prefix='swc-bench-')
+    else:
+        site_dir = os.path.join(keep_dir, 'site-%d' % size)
+        if os.path.isdir(site_dir):
+            shutil.rmtree(site_dir)
+    cache_dir = os.path.join(site_dir, '_cache')
+
+    try:
+        generator = SiteGenerator(site_dir, size)
+        generator()
+
+        results = []
+        common = {'version' : label,
+                  'size' : size,
+                  'jobs' : jobs,
+                  'python' : sys.version.split()[0],
+                  'when' : datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+        cold = build(site_dir, jobs, cache_dir)
+        cold.update(common, mode='cold')
+        results.append(cold)
+
+        # Change one post, making sure its timestamp moves.
+        path = os.path.join(site_dir, generator.last_post)
+        with open(path, 'a') as writer:
+            writer.write('\n')
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 1))
+
+        incremental = build(site_dir, jobs, cache_dir)
+        incremental.update(common, mode='incremental')
+        results.append(incremental)
+        return results
+
+    finally:
+        if keep_dir is None:
+            shutil.rmtree(site_dir)
+
+#-------------------------------------------------------------------------------
+
+def load_results(filename):
+    """
+    Load previously-stored results (if any).
+    """
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, 'r') as reader:
+        return [json.loads(line) for line in reader if line.strip()]
+
+def previous(history, result):
+    """
+    Find the most recent result for the same size and mode from a
+    different version, or None.
+    """
+    for old in reversed(history):
+        if (old['size'], old['mode'], old.get('jobs')) == \
+           (result['size'], result['mode'], result.get('jobs')) and \
+           (old['version'] != result['version']):
+            return old
+    return None
+
+def report(result, old):
+    """
+    Show a result, compared with an earlier one if there is one.
+    """
+    print('%(size)7d posts  %(mode)-11s  %(pages)7d pages  %(seconds)8.2f s  '
+          '%(pages_per_second)8.1f pages/s  %(peak_rss_kb)8d KB' % result)
+    if old is not None:
+        speed = 100.0 * (result['pages_per_second'] / old['pages_per_second'] - 1)
+        memory = 100.0 * (float(result['peak_rss_kb']) / old['peak_rss_kb'] - 1)
+        print('%7s        vs %s: %+.1f%% pages/s, %+.1f%% memory' % \
+              ('', old['version'], speed, memory))
+    phases = sorted(result['phases'].items(), key=lambda x: -x[1])
+    print('%7s        %s' % ('', ', '.join('%s %.2fs' % p for p in phases)))
+
+#-------------------------------------------------------------------------------
+
+def version_label():
+    """
+    Describe the current version of the code.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                             cwd=BIN_DIR, stderr=devnull)
+        return output.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def usage(exit_status):
+    """
+    Show usage and exit.
+    """
+    sys.stderr.write(USAGE)
+    sys.exit(exit_status)
+
+def main(args):
+    """
+    Main driver.
+    """
+    jobs, keep_dir, label, results_file = 1, None, None, DEFAULT_RESULTS
+    options, sizes = getopt.getopt(args, 'hj:k:l:o:')
+    for opt, arg in options:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-j':
+            jobs = int(arg)
+        elif opt == '-k':
+            keep_dir = arg
+        elif opt == '-l':
+            label = arg
+        elif opt == '-o':
+            results_file = arg
+        else:
+            assert False, \
+                   'Unknown option %s' % opt
+
+    sizes = [int(s) for s in sizes] or DEFAULT_SIZES
+    if label is None:
+        label = version_label()
+    history = load_results(results_file)
+    directory = os.path.dirname(results_file)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    for size in sizes:
+        for result in run(size, keep_dir, jobs, label):
+            report(result, previous(history, result))
+            with open(results_file, 'a') as writer:
+                writer.write(json.dumps(result, sort_keys=True))
+                writer.write('\n')
+            history.append(result)
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
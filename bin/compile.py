@@ -79,33 +79,83 @@ What we have right now looks like this:
 
 import sys
 import os
+import io
 import glob
 import re
 import getopt
 import json
+import contextlib
+import fnmatch
 import jinja2
+import mimetypes
 import time
 import datetime
+import hashlib
+import collections
+import multiprocessing
+import tempfile
+import traceback
 try:  # Python 3
-    from urllib.parse import urlparse, urljoin
+    from urllib.parse import urlparse, urljoin, unquote
+    from http.server import HTTPServer, BaseHTTPRequestHandler
 except ImportError:  # Python 2
     from urlparse import urlparse, urljoin
+    from urllib import unquote
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+try:  # Python 2
+    STRING_TYPES = basestring
+except NameError:  # Python 3
+    STRING_TYPES = str
 
 from PyRSS2Gen import RSS2, RSSItem, Guid
+from assets import AssetStage, ASSET_PATTERNS
+from links import find_hrefs, find_ids, missing_anchors, normalize
+from metaindex import MetadataIndex, extract_metadata
+from minify import Minifier
+from precompress import EXTENSIONS as COMPRESSIBLE, MIN_SIZE as MIN_COMPRESS_SIZE, gzip_bytes
+from searchindex import SearchIndex
+from watcher import Watcher
 
 #----------------------------------------
 
 USAGE = """compile.py [options] initial_file_path: rebuild Software Carpentry web site
+--assets                                put static files in the output directory
+                                        (with fingerprinted names for templates)
+-b build_cache_directory_path           optional (kept between builds)
 -c calendar_file_name                   optional
+--check-links                           optional (report links in rendered
+                                        pages that don't lead anywhere, or
+                                        to anchors that aren't there)
 -d today's date                         YYY-MM-DD
 -h                                      show this help and exit
+-j number_of_jobs                       optional (render pages in parallel)
 -m metadata_json_file_path
+--minify                                optional (strip comments and collapse
+                                        whitespace in rendered pages)
+--only=page_path                        optional, may be used multiple times
+                                        (only render these pages and their
+                                        parents, loading as little as possible)
 -o output_directory_path
 -p jinja2_template_search_path          may be used multiple times
 -r blog_rss_file_path
 -s site_url
+--search=search_index_directory_path    optional (build a client-side search
+                                        index of posts and lessons there;
+                                        must be inside the output directory)
+--serve=port                            optional (instead of building, serve
+                                        the site at http://localhost:port/,
+                                        rendering pages when they are asked for)
 -v                                      make verbose
 -x                                      shorten blog excerpts
+--profile=trace_file_path               optional (time each build phase, and
+                                        save results as a Chrome trace)
+--reproducible                          pin timestamps to $SOURCE_DATE_EPOCH
+                                        (or the -d date) so that identical
+                                        input gives identical output
+--watch                                 optional (after building, keep
+                                        running and rebuild whenever files
+                                        in the search path change)
 """
 
 CONTACT_EMAIL   = 'info@software-carpentry.org'
@@ -114,7 +164,17 @@ GOOGLE_PLUS_URL = 'https://plus.google.com/u/0/114244759874490019250/posts'
 TWITTER_NAME    = '@swcarpentry'
 TWITTER_URL     = 'https://twitter.com/swcarpentry'
 
-METADATA_TEMPLATE = r'<meta\s+name="%s"\s+content="([^"]*)"\s*/>'
+
+TEMPLATE_CACHE_DIR = 'templates'
+METADATA_INDEX_FILE = 'metadata.sqlite'
+SEARCH_CACHE_FILE = 'search.json'
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+SOURCE_CACHE_SIZE = 16 * 1024 * 1024
+
+# Marks page attributes that haven't been given values yet.
+_UNSET = object()
 
 MONTHS = {
     '01' : 'Jan', '02' : 'Feb', '03' : 'Mar', '04' : 'Apr',
@@ -129,6 +189,12 @@ BLOG_EXCERPT_LENGTH = 200
 BLOG_CONTENT_PATTERN = re.compile(r'{% block content %}(.+){% endblock content %}', re.DOTALL)
 BLOG_TAG_REPLACEMENT_PATTERN = re.compile(r'<[^>]+>')
 
+BLOG_INDEX = 'blog/index.html'
+BOOTCAMP_INDEX = 'bootcamps/index.html'
+
+ARCHIVE_PAGE_SIZE = 20
+ARCHIVE_SLUG_PATTERN = re.compile(r'[^a-z0-9_.-]+')
+
 #----------------------------------------
 
 class Application(object):
@@ -144,18 +210,46 @@ class Application(object):
         """
         Initialize settings, parse command line, create rendering environment.
         """
+        self.assets = None
+        self.cache_dir = None
+        self.check_links = False
+        self.depgraph = None
+        self.sources = None
+        self.writer = None
         self.env = None
         self.metadata = None
+        self.metadata_filename = None
+        self.metadata_ids = None
+        self.metaindex = None
+        self.minify = False
         self.output_dir = None
         self.blog_filename = None
+        self.build_time = None
         self.icalendar_filename = None
+        self.jobs = 1
+        self.links = None
+        self.only = []
+        self.profiler = None
+        self.profile_filename = None
+        self.publish_assets = False
         self.search_path = []
+        self.reproducible = False
+        self.search_dir = None
+        self.search_url = None
+        self.search_index = None
+        self.serve_port = None
         self.site = None
         self.today = None
         self.verbosity = 0
         self.shorten_blog_excerpts = False
+        self.watch = False
 
+        self.args = args
         self.filenames = self._parse(args)
+        self.profiler = Profiler(self.profile_filename)
+        self._open_metaindex()
+        self._find_assets()
+        self._set_build_time()
         self._build_env()
         self._load_metadata()
 
@@ -174,19 +268,45 @@ class Application(object):
                 'filename'        : filename,
                 'google_plus_url' : GOOGLE_PLUS_URL,
                 'root_path'       : root_path,
+                'search_index'    : self.search_url,
                 'site'            : self.site,
-                'timestamp'       : timestamp(),
+                'timestamp'       : self.timestamp(),
                 'today'           : self.today,
                 'twitter_name'    : TWITTER_NAME,
                 'twitter_url'     : TWITTER_URL}
 
+    def timestamp(self):
+        """
+        Return the time to stamp generated files with, formatted in ISO
+        8601: the pinned build time in reproducible builds, or the
+        current UTC time otherwise.
+        """
+        if self.reproducible:
+            return self.build_time.strftime(TIMESTAMP_FORMAT)
+        return timestamp()
+
+    def build_datetime(self):
+        """
+        Return the build time as a datetime (e.g., for feeds).
+        """
+        if self.reproducible:
+            return self.build_time
+        return datetime.datetime.utcnow()
+
     def _parse(self, args):
         """
         Parse command-line options.
         """
-        options, filenames = getopt.getopt(args, 'c:d:hm:o:p:r:s:vx')
+        options, filenames = getopt.getopt(args, 'b:c:d:hj:m:o:p:r:s:vx',
+                                           ['assets', 'check-links', 'minify',
+                                            'only=', 'profile=', 'reproducible',
+                                            'search=', 'serve=', 'watch'])
         for opt, arg in options:
-            if opt == '-c':
+            if opt == '-b':
+                assert self.cache_dir is None, \
+                       'Build cache directory specified multiple times'
+                self.cache_dir = arg
+            elif opt == '-c':
                 assert self.icalendar_filename is None, \
                        'iCalendar filename specified multiple times'
                 self.icalendar_filename = arg
@@ -194,10 +314,14 @@ class Application(object):
                 self.today = arg
             elif opt == '-h':
                 usage(0)
+            elif opt == '-j':
+                assert arg.isdigit() and int(arg) > 0, \
+                       'Number of jobs must be a positive integer'
+                self.jobs = int(arg)
             elif opt == '-m':
-                assert self.metadata is None, \
+                assert self.metadata_filename is None, \
                        'Metadata specified multiple times'
-                self.metadata = arg
+                self.metadata_filename = arg
             elif opt == '-o':
                 assert self.output_dir is None, \
                        'Destination directory specified multiple times'
@@ -216,6 +340,30 @@ class Application(object):
                 self.verbosity += 1
             elif opt == '-x':
                 self.shorten_blog_excerpts = True
+            elif opt == '--assets':
+                self.publish_assets = True
+            elif opt == '--check-links':
+                self.check_links = True
+            elif opt == '--minify':
+                self.minify = True
+            elif opt == '--only':
+                self.only.append(os.path.normpath(arg))
+            elif opt == '--profile':
+                assert self.profile_filename is None, \
+                       'Profile filename specified multiple times'
+                self.profile_filename = arg
+            elif opt == '--reproducible':
+                self.reproducible = True
+            elif opt == '--search':
+                assert self.search_dir is None, \
+                       'Search index directory specified multiple times'
+                self.search_dir = arg
+            elif opt == '--serve':
+                assert arg.isdigit() and 0 < int(arg) < 65536, \
+                       'Port must be a number between 1 and 65535'
+                self.serve_port = int(arg)
+            elif opt == '--watch':
+                self.watch = True
             else:
                 assert False, \
                 'Unknown option %s' % opt
@@ -228,26 +376,233 @@ class Application(object):
                'No search path directories specified (use -p)'
         assert self.site is not None, \
                'No site specified (use -s)'
+        assert not (self.watch and self.only), \
+               'Cannot watch for changes in a partial (--only) build'
+        assert (self.serve_port is None) or not (self.watch or self.only), \
+               'Cannot serve the site while watching or in a partial (--only) build'
+
+        # Pages find the search index by its path from the site root.
+        if self.search_dir is not None:
+            self.search_url = os.path.relpath(self.search_dir, self.output_dir)
+            assert self.search_url.split(os.sep)[0] not in (os.curdir, os.pardir), \
+                   'Search index directory must be inside the output directory'
+            self.search_url = self.search_url.replace(os.sep, '/')
 
         return filenames
 
-    def _build_env(self):
+    def _open_metaindex(self):
+        """
+        Open the index of page metadata kept in the build cache
+        directory (or an empty one that isn't saved, if there's no
+        cache directory).
+        """
+        filename = None
+        if self.cache_dir is not None:
+            filename = os.path.join(self.cache_dir, METADATA_INDEX_FILE)
+        self.metaindex = MetadataIndex(filename)
+
+    def _find_assets(self):
+        """
+        Find and fingerprint static files (if they're to be published),
+        so that templates can refer to them by their hashed names.
+        The development server sends static files as they are, so
+        they keep their own names there.
+        """
+        if self.publish_assets and (self.serve_port is None):
+            self.assets = AssetStage(self.output_dir, self.cache_dir)
+
+    def asset(self, path):
+        """
+        Return the path (from the site root) to link to for a static
+        file: its fingerprinted name if assets are being published,
+        or the path itself if not.  Available in templates as 'asset'.
         """
-        Create template expansion environment.
+        if self.assets is None:
+            return path
+        return self.assets.url(path)
+
+    def _set_build_time(self):
+        """
+        Pin the time used for timestamps in reproducible builds, using
+        $SOURCE_DATE_EPOCH if it is set (the usual convention for
+        reproducible builds) or midnight UTC on the -d date if not.
+        """
+        epoch = os.environ.get('SOURCE_DATE_EPOCH')
+        if epoch:
+            self.build_time = datetime.datetime.utcfromtimestamp(int(epoch))
+        else:
+            self.build_time = datetime.datetime.strptime(self.today, '%Y-%m-%d')
+
+    def _build_env(self):
         """
-        loader = jinja2.FileSystemLoader(self.search_path)
+        Create template expansion environment.  Templates are loaded
+        through the same source store as page metadata so that each
+        file is only read once.  If there is a build cache directory,
+        compiled templates are kept there between builds; Jinja2
+        checks each one against a checksum of its source before
+        reusing it.
+        """
+        self.sources = SourceStore(self.search_path)
+        loader = SourceStoreLoader(self.sources)
+        bytecode_cache = None
+        if self.cache_dir is not None:
+            directory = os.path.join(self.cache_dir, TEMPLATE_CACHE_DIR)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
         self.env = jinja2.Environment(loader=loader,
-                                      autoescape=True)
+                                      autoescape=True,
+                                      bytecode_cache=bytecode_cache)
+        self.env.globals['asset'] = self.asset
 
     def _load_metadata(self):
         """
-        Load blog metadata translation information (if specified).
+        Load blog metadata translation information (if specified), and
+        invert it so that translated values can be mapped back to
+        their short IDs (e.g., for naming archive pages).
         """
-        if self.metadata is None:
+        if self.metadata_filename is None:
             self.metadata = {}
         else:
-            with open(self.metadata, 'r') as reader:
+            with open(self.metadata_filename, 'r') as reader:
                 self.metadata = json.load(reader)
+        self.metadata_ids = {}
+        for (outer, inner) in self.metadata.items():
+            self.metadata_ids[outer] = dict((value, key) for (key, value)
+                                            in sorted(inner.items(), reverse=True))
+
+    def needs_children(self, page, filenames):
+        """
+        Decide whether a page's children have to be loaded.  They
+        always are in full builds.  In partial (--only) builds, they are
+        needed if the page is itself being rendered (it may be an
+        index of its children), or if any of them is being rendered or
+        might lead to one that is (because it lives in a directory
+        above a page being rendered).  In that case all of them are
+        loaded, since the siblings of a page determine its previous and
+        next links; children that aren't on the way to a page being
+        rendered won't load their own children in turn.
+        """
+        if not self.only:
+            return True
+        if os.path.normpath(page.filename) in self.only:
+            return True
+        for f in filenames:
+            f = os.path.normpath(f)
+            if f in self.only:
+                return True
+            directory = os.path.dirname(f)
+            if not directory:
+                return True
+            prefix = directory + os.sep
+            if any(target.startswith(prefix) for target in self.only):
+                return True
+        return False
+
+    def refresh(self, changed):
+        """
+        Forget what is known about files that have changed (in watch
+        mode) before the site is rebuilt: reload the metadata file and
+        re-hash static files if any of them have changed.
+        """
+        self.metaindex.refresh(changed)
+        changed = set(os.path.abspath(f) for f in changed)
+        if (self.metadata_filename is not None) and \
+           (os.path.abspath(self.metadata_filename) in changed):
+            self._load_metadata()
+        if (self.assets is not None) and \
+           any(self.assets.covers(os.path.relpath(f)) for f in changed):
+            self._find_assets()
+
+    def settings(self):
+        """
+        Return the command-line settings that affect every rendered
+        page, so that changing any of them forces a full rebuild.
+        (Since any page may refer to fingerprinted static files, so
+        does changing any of those.)
+        """
+        return [self.output_dir, self.site, self.today,
+                self.shorten_blog_excerpts, self.minify,
+                self.search_url,
+                self.assets.signature() if self.assets else None]
+
+#----------------------------------------
+
+class SourceStore(object):
+    """
+    Read each source file once and share the text between the page
+    factory (looking for page classes and template references), page
+    objects (extracting metadata), and Jinja2 (via SourceStoreLoader).
+    Files are keyed by normalized path and checked against their
+    modification time, so an edited file is read again.  The store
+    holds at most 'limit' characters, discarding the least recently
+    used files first, so memory doesn't grow with the size of the site.
+    """
+
+    def __init__(self, search_path, limit=SOURCE_CACHE_SIZE):
+        self.search_path = search_path
+        self.limit = limit
+        self.size = 0
+        self.cache = collections.OrderedDict()
+
+    def read(self, filename):
+        """
+        Return the text of a file, reading it only if it isn't
+        already cached or has changed since it was read.
+        """
+        key = os.path.normpath(filename)
+        mtime = os.stat(key).st_mtime
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+        if (entry is None) or (entry[0] != mtime):
+            with io.open(key, 'r', encoding='utf-8') as reader:
+                entry = (mtime, reader.read())
+
+        # (Re-)insert as the most recently used file.
+        self.cache[key] = entry
+        self.size += len(entry[1])
+        while (self.size > self.limit) and (len(self.cache) > 1):
+            old_key, old_entry = self.cache.popitem(last=False)
+            self.size -= len(old_entry[1])
+        return entry[1]
+
+    def find(self, name):
+        """
+        Return the path of the first file with the given name in the
+        search path, or None.
+        """
+        for d in self.search_path:
+            f = os.path.join(d, name)
+            if os.path.isfile(f):
+                return f
+        return None
+
+#----------------------------------------
+
+class SourceStoreLoader(jinja2.BaseLoader):
+    """
+    Jinja2 template loader that serves templates from a SourceStore
+    instead of reading them from disk again.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_source(self, environment, template):
+        path = self.store.find(template)
+        if path is None:
+            raise jinja2.TemplateNotFound(template)
+        mtime = os.path.getmtime(path)
+        source = self.store.read(path)
+
+        def uptodate():
+            try:
+                return os.path.getmtime(path) == mtime
+            except OSError:
+                return False
+
+        return source, path, uptodate
 
 #----------------------------------------
 
@@ -259,10 +614,24 @@ class GenericPage(object):
       with the same name.
     * UPLINK is how to get 'up' in the hierarchy (e.g., up to the
       index page for a lesson).
+    * SEARCHABLE is true if the page's content should be included in
+      the site's search index.
+    Pages use __slots__ to keep the thousands of page objects small,
+    so every attribute a class sets (including the fields named in
+    its KEYS) must be listed in its __slots__.  The page's source text
+    is only kept while the page is being constructed.
     """
 
     KEYS = '*subfile *subglob title'.split()
     UPLINK = ''
+    SEARCHABLE = False
+
+    __slots__ = ['app', 'filename', 'original', 'parent', 'children',
+                 'uplink', 'prev', 'next',
+                 '_factory', '_directory', '_sort_key', '_data',
+                 'subfile', 'subglob', 'title']
+
+    _KEY_CACHE = {}
 
     def __init__(self, app, factory, filename, original, parent):
         """
@@ -278,14 +647,21 @@ class GenericPage(object):
         self.parent = parent
         self.children = []
         self.uplink = self.UPLINK
+        self.prev = None
+        self.next = None
 
         self._factory = factory
         self._directory = os.path.dirname(filename)
         self._sort_key = None
 
-        self._load_file()
-        self._get_metadata()
-        self._finalize_self()
+        phase = app.profiler.phase
+        with phase('load_file', filename):
+            self._load_file()
+        with phase('get_metadata', filename):
+            self._get_metadata()
+        with phase('finalize_self', filename):
+            self._finalize_self()
+        self._data = None
         self._load_subfiles()
         self._finalize_children()
 
@@ -298,101 +674,164 @@ class GenericPage(object):
 
     def render(self):
         """
-        Render this page and its children.
+        Render this page and its children.  Pages whose inputs haven't
+        changed since the last build are skipped.
         """
-        self._render()
+        if self.app.depgraph.is_stale(self):
+            self._render()
+            self.app.depgraph.record(self)
         for child in self.children:
             child.render()
 
+    def template_name(self):
+        """
+        Return the name of the template this page is rendered from
+        (which is its own source file).
+        """
+        return self.filename
+
+    def search_text(self):
+        """
+        Return the text to index for searching (the page's content
+        block).  Only called for pages that are new or have changed.
+        """
+        m = BLOG_CONTENT_PATTERN.search(self.app.sources.read(self.filename))
+        if m:
+            return m.group(1)
+        return ''
+
+    def walk(self):
+        """
+        Yield this page and its descendants in rendering order.
+        """
+        yield self
+        for child in self.children:
+            for page in child.walk():
+                yield page
+
     def _load_file(self):
         """
-        Load file data, which is then stored as a single block of
-        characters and as a list of lines (since we need both in
-        different cases).
+        Load file data, which is stored as a single block of characters
+        until the page object has been finalized.  If the metadata
+        index already has this file's metadata, the file isn't read
+        (see _source).
         """
-        with open(self.filename, 'r') as reader:
-            self._data = reader.read()
-        self._block = self._data
-        self._lines = self._block.split('\n')
+        row = self.app.metaindex.lookup(self.filename)
+        if (row is not None) and (row['metadata'] is not None):
+            self._data = None
+        else:
+            self._data = self.app.sources.read(self.filename)
 
-    def _get_patterns(self):
+    def _source(self):
         """
-        Return triples of (field name, default value, regexp) for
-        matching metadata fields.  Requires this class to have a
-        'KEYS' member.  If a key name starts with a '*', the key can
-        have multiple values.
+        Return the file's text, reading it now if it wasn't needed for
+        extracting metadata.
         """
-        result = []
-        for k in self.KEYS:
-            multi, default = k.startswith('*'), None
-            if multi:
-                k, default = k[1:], []
-            r = re.compile(METADATA_TEMPLATE % k)
-            result.append([k, default, r])
-        return result
+        if self._data is None:
+            self._data = self.app.sources.read(self.filename)
+        return self._data
+
+    @classmethod
+    def _get_keys(cls):
+        """
+        Return a dictionary mapping the names of metadata fields to
+        whether they can have multiple values.  Requires this class to
+        have a 'KEYS' member.  If a key name starts with a '*', the key
+        can have multiple values.  The result is computed once per
+        class, since every page of a class uses the same keys.
+        """
+        if cls not in GenericPage._KEY_CACHE:
+            result = {}
+            for k in cls.KEYS:
+                multi = k.startswith('*')
+                result[k.lstrip('*')] = multi
+            GenericPage._KEY_CACHE[cls] = result
+        return GenericPage._KEY_CACHE[cls]
 
     def _get_metadata(self):
         """
-        Extract metadata embedded in <meta...> tags using the patterns
-        constructed by _get_patterns.  These values are stored as
-        member variables in this object.
+        Extract metadata embedded in <meta...> tags for the fields
+        named in KEYS.  These values are stored as member variables in
+        this object.  All the tags are found in a single pass over the
+        file_metadata block (or the whole file if there is no such
+        block), or taken from the metadata index if the file hasn't
+        changed since it was indexed; tags for fields not in KEYS are
+        ignored.
         """
-        for (field, default, pat) in self._get_patterns():
-            self._set_metadata(field, default)
-            for line in self._lines:
-                match = pat.search(line)
-                if match:
-                    self._set_metadata(field, match.group(1))
+        keys = self._get_keys()
+        for (field, multi) in keys.items():
+            self._set_metadata(field, [] if multi else None)
+
+        if self._data is None:
+            found = self.app.metaindex.lookup(self.filename)['metadata']
+        else:
+            found = extract_metadata(self._data)
+            self.app.metaindex.set_metadata(self.filename, self._data, found)
+        for (field, value) in found:
+            if field in keys:
+                self._set_metadata(field, value)
 
     def _set_metadata(self, field, value):
         """
         Store metadata extracted from a <meta...> tag as a member
         variable of this object.
         """
+        current = getattr(self, field, _UNSET)
+
         # Member variable doesn't exist at all yet, so assign value.
         # If the key can have multiple values, the initial value must
         # be a list.
-        if field not in self.__dict__:
+        if current is _UNSET:
             assert value in (None, []), \
                    'Must initialize to None (single) or [] (multi)'
-            self.__dict__[field] = value
+            setattr(self, field, value)
 
         # Member variable already exists and is a list, so the
         # variable can be multi-valued, so append.
-        elif type(self.__dict__[field]) is list:
-            self.__dict__[field].append(value)
+        elif type(current) is list:
+            current.append(value)
 
         # Member variable already exists, so check that its value is
         # None (i.e., that it hasn't already been initialized), and
         # then set its value.
         else:
-            assert self.__dict__[field] is None, \
+            assert current is None, \
                    'Single-valued field %s being reset' % field
-            self.__dict__[field] = value
+            setattr(self, field, value)
 
     def _load_subfiles(self):
         """
-        Load sub-files recursively.
+        Load sub-files recursively.  In partial builds, the application
+        decides which (if any) of them are needed.
         """
 
         # Get children that are named explicitly.
-        self.children = [self._factory(os.path.join(self._directory, sf), sf, self)
-                         for sf in self.subfile]
+        found = [(os.path.join(self._directory, sf), sf)
+                 for sf in self.subfile]
 
         # Get children by globbing.
         sort = False
-        if 'subglob' in self.__dict__:
+        if self.subglob:
             sort = True
             for sg in self.subglob:
                 whole_glob = os.path.join(self._directory, sg)
-                matches = [self._factory(m, None, self)
-                           for m in glob.glob(whole_glob)]
-                self.children += matches
+                with self.app.profiler.phase('discover', self.filename):
+                    matches = sorted(glob.glob(whole_glob))
+                found += [(m, None) for m in matches]
+
+        if not self.app.needs_children(self, [f for (f, original) in found]):
+            found = []
+        self.children = [self._factory(f, original, self)
+                         for (f, original) in found]
 
         # If anything was globbed, sort everything (including children
-        # that were loaded explicitly).
+        # that were loaded explicitly).  Ties are broken by load order
+        # so that prev/next links are the same from one build to the
+        # next.
         if sort:
-            self.children.sort(key=lambda x: (x._sort_key, id(x)))
+            keyed = [(child._sort_key, i, child)
+                     for (i, child) in enumerate(self.children)]
+            self.children = [child for (key, i, child) in sorted(keyed)]
 
     def _finalize_children(self):
         """
@@ -412,28 +851,37 @@ class GenericPage(object):
                'No application metadata for [%s][%s]' % (outer, inner)
         return self.app.metadata[outer][inner]
 
+    def expand(self):
+        """
+        Expand this page's template, returning the text.
+        """
+        phase = self.app.profiler.phase
+        with phase('load_template', self.filename):
+            template = self.app.env.get_template(self.template_name())
+        with phase('render_template', self.filename):
+            context = dict(page=self, **self.app.standard(self.filename))
+            if self.app.minify:
+                return ''.join(Minifier()(template.generate(**context)))
+            return template.render(**context)
+
     def _render(self):
         """
-        Render and save this page.
+        Render and save this page, returning the output path and the
+        hash of what was written there.
         """
         if self.app.verbosity > 0:
             sys.stderr.write(self.filename)
             sys.stderr.write('\n')
-
-        # Render.
-        template = self.app.env.get_template(self.filename)
-        result = template.render(page=self,
-                                 **self.app.standard(self.filename))
-
-        # Make sure the output directory exists.
+        result = self.expand()
         dest = os.path.join(self.app.output_dir, self.filename)
-        directory = os.path.dirname(dest)
-        if not os.path.isdir(directory):
-            os.makedirs(directory)
+        if self.app.links is not None:
+            self.app.links.add(dest, result)
 
-        # Save the rendered text.
-        with open(dest, 'w') as writer:
-            writer.write(result)
+        # Save the rendered text (if it has changed), reporting what
+        # was written so that parallel workers can tell the parent.
+        with self.app.profiler.phase('write', self.filename):
+            digest = self.app.writer.write(dest, result)
+        return (dest, digest)
 
     def _finalize_self(self):
         """
@@ -446,8 +894,6 @@ class GenericPage(object):
 class BootCampPage(GenericPage):
     """
     Represent information about a boot camp.
-    The 'Instances' class variable keeps track of all created instances,
-    so that they can be used to render the iCalendar feed.
     """
 
     KEYS = GenericPage.KEYS + \
@@ -456,11 +902,9 @@ class BootCampPage(GenericPage):
 
     UPLINK = 'index.html'
 
-    Instances = []
-
-    def __init__(self, *args):
-        GenericPage.__init__(self, *args)
-        BootCampPage.Instances.append(self)
+    __slots__ = ['venue', 'latlng', 'date', 'startdate', 'enddate',
+                 'registration', 'eventbrite_key', 'instructor',
+                 'instructors', 'slug']
 
     def _finalize_self(self):
         """
@@ -468,12 +912,15 @@ class BootCampPage(GenericPage):
         * Create normalized date for display.
         * Create slug.
         * Create sort key (start date and venue).
+        * Translate instructor IDs to names, keeping the list (for
+          archives) as well as a human-readable version for display.
         """
         self._merge_dates()
         self.slug = os.path.splitext(os.path.basename(self.filename))[0]
         self._sort_key = (self.startdate, self.venue)
 
         self.instructor = [self._app_meta('author_id', x) for x in self.instructor]
+        self.instructors = self.instructor
         if len(self.instructor) == 0:
             self.instructor = None
         elif len(self.instructor) == 1:
@@ -541,6 +988,9 @@ class LessonPage(GenericPage):
     """
 
     UPLINK = '../index.html'
+    SEARCHABLE = True
+
+    __slots__ = ['slug', 'keypoints']
 
     KEYPOINTS = re.compile(r'<ul\s+class="keypoints"\s*>(.+?)</ul>', re.DOTALL)
 
@@ -561,7 +1011,7 @@ class LessonPage(GenericPage):
           index page.
         """
         self.slug = os.path.dirname(self.filename).split('/')[-1]
-        m = self.KEYPOINTS.search(self._data)
+        m = self.KEYPOINTS.search(self._source())
         assert m, \
                'No keypoints found in %s' % self.filename
         self.keypoints = m.group(1)
@@ -574,6 +1024,9 @@ class TopicPage(GenericPage):
     """
 
     UPLINK = 'index.html'
+    SEARCHABLE = True
+
+    __slots__ = ['slug']
 
     def _finalize_self(self):
         """
@@ -589,6 +1042,8 @@ class BlogIndexPage(GenericPage):
     Singleton to store information about all blog posts.
     """
 
+    __slots__ = ['blog_history_length', 'years', 'months', '_posts']
+
     def __init__(self, *args):
         GenericPage.__init__(self, *args)
         self.blog_history_length = BLOG_HISTORY_LENGTH
@@ -630,20 +1085,24 @@ class BlogIndexPage(GenericPage):
 class BlogPostPage(GenericPage):
     """
     Represent information about a single blog post.
-    The 'Instances' class variable keeps track of all created instances,
-    so that they can be used to render the blog feed.
+    The post's content is only read when it's needed (for the handful
+    of recent posts that appear in the blog index and the feed).
     """
 
     KEYS = GenericPage.KEYS + \
            ['post_id', 'post_date', 'author_id', '*category']
 
     UPLINK = '../../index.html'
+    SEARCHABLE = True
 
-    Instances = []
+    __slots__ = ['post_id', 'post_date', 'author_id', 'category',
+                 'year', 'month', 'name',
+                 '_content_template', '_rendered_content']
 
     def __init__(self, *args):
+        self._content_template = None
+        self._rendered_content = {}
         GenericPage.__init__(self, *args)
-        BlogPostPage.Instances.append(self)
 
     def link(self):
         """
@@ -660,7 +1119,42 @@ class BlogPostPage(GenericPage):
         """
         return '/'.join([self.year, self.month, self.name])
 
-    def excerpt(self, excerpt_filename):
+    def archive_link(self, field, value):
+        """
+        Return the path (from the site root) of the archive of posts
+        that share this value of a field (e.g., 'category') with this
+        one.
+        """
+        return ArchivePage.path_for(self.app, BlogPostPage, field, value)
+
+    def render_content(self, **context):
+        """
+        Expand the content block of this post.  The block is compiled
+        at most once per post, and the expansion is remembered for each
+        distinct context, so the blog index page and the RSS feed don't
+        compile and render the same post over and over.
+        """
+        key = tuple(sorted(context.items()))
+        if key not in self._rendered_content:
+            if self._content_template is None:
+                content = self.content
+                if not content:
+                    return ''
+                self._content_template = jinja2.Template(content)
+            self._rendered_content[key] = self._content_template.render(**context)
+        return self._rendered_content[key]
+
+    @property
+    def content(self):
+        """
+        The text of the post's content block (or None).
+        """
+        m = BLOG_CONTENT_PATTERN.search(self.app.sources.read(self.filename))
+        if m:
+            return m.group(1)
+        return None
+
+    def excerpt(self, excerpt_filename, root_path=None):
         """
         Return an excerpt of the page for display in the RSS reader by:
         * finding the content block
@@ -672,17 +1166,15 @@ class BlogPostPage(GenericPage):
         * hoping the result isn't too horribly mangled.
         The right way to do this would be to have an explicit excerpt
         div or span in the blog posts, but that's not what we inherited
-        from WordPress.
+        from WordPress.  If 'root_path' is given, it overrides the
+        relative path to the site root (e.g., for feeds).
         """
 
-        # No text in blog post.
-        if not self.content:
-            return ''
-
         # Translate the content block.
-        template = jinja2.Template(self.content)
-        result = template.render(page=self,
-                                 **self.app.standard(excerpt_filename))
+        context = self.app.standard(excerpt_filename)
+        if root_path is not None:
+            context['root_path'] = root_path
+        result = self.render_content(page=self, **context)
         if not self.app.shorten_blog_excerpts:
             return result
 
@@ -704,48 +1196,283 @@ class BlogPostPage(GenericPage):
         self._sort_key = int(self.post_id)
         self.year, self.month, self.name = self.filename.split('/')[-3:]
 
-        self.content = None
-        m = BLOG_CONTENT_PATTERN.search(self._block)
-        if m:
-            self.content = m.group(1)
-
         for key in self.app.metadata:
-            if key not in self.__dict__:
+            value = getattr(self, key, _UNSET)
+            if value is _UNSET:
                 pass
-            elif type(self.__dict__[key]) is str:
-                self.__dict__[key] = self._app_meta(key, self.__dict__[key])
-            elif type(self.__dict__[key]) is list:
-                self.__dict__[key] = [self._app_meta(key, v) for v in self.__dict__[key]]
+            elif isinstance(value, STRING_TYPES):
+                setattr(self, key, self._app_meta(key, value))
+            elif type(value) is list:
+                setattr(self, key, [self._app_meta(key, v) for v in value])
             else:
                 assert False, 'Bad metadata translation setup'
 
 #----------------------------------------
 
+class ArchivePage(GenericPage):
+    """
+    One page of a generated archive listing the pages (blog posts or
+    boot camps) that share a value of some field, such as a category
+    or an author.  Archive pages have no source file of their own:
+    they are rendered from TEMPLATE, and their children are the pages
+    they list (newest first, PAGE_SIZE to a page), so the dependency
+    graph re-renders them when any of those pages change.
+    Each kind of archive is a subclass that specifies:
+    * PAGE_CLASS: the class of the pages being archived.
+    * FIELD: the attribute of those pages to group them by.
+    * METADATA: the metadata section used to translate the field's
+      values (so that archives can be named by ID rather than by name).
+    * DIRECTORY: where the archive's pages go.
+    * INDEX: the page to go 'up' to from the archive.
+    * TITLE: a format for the title, given the field's value.
+    Kinds of archives are listed in ARCHIVE_CLASSES.
+    """
+
+    PAGE_CLASS = None
+    FIELD = None
+    METADATA = None
+    DIRECTORY = None
+    INDEX = None
+    TITLE = None
+    TEMPLATE = None
+    PAGE_SIZE = ARCHIVE_PAGE_SIZE
+
+    __slots__ = ['value', 'number', 'count']
+
+    def __init__(self, app, value, slug, items, number, count):
+        """
+        Create page 'number' of 'count' of the archive for 'value'.
+        (Unlike other pages, nothing is loaded from a file.)
+        """
+        self.app = app
+        self.filename = self._page_filename(slug, number)
+        self.original = None
+        self.parent = None
+        self.children = items
+        self.uplink = os.path.relpath(self.INDEX, os.path.dirname(self.filename))
+        self.prev = None if (number == 1) \
+                    else os.path.basename(self._page_filename(slug, number-1))
+        self.next = None if (number == count) \
+                    else os.path.basename(self._page_filename(slug, number+1))
+        self.title = self.TITLE % value
+        self.value = value
+        self.number = number
+        self.count = count
+
+    def template_name(self):
+        """
+        Archive pages are all rendered from the same template.
+        """
+        return self.TEMPLATE
+
+    @classmethod
+    def create(cls, app, pages):
+        """
+        Create all the pages of this kind of archive.
+        """
+        pages = sorted(pages, key=lambda p: p._sort_key, reverse=True)
+        result = []
+        names = {}
+        for (value, items) in sorted(cls._index(pages).items()):
+            slug = cls._slug(app, value)
+            assert names.setdefault(slug, value) == value, \
+                   'Archives for "%s" and "%s" would both be %s' % \
+                   (names[slug], value, cls._page_filename(slug, 1))
+            count = (len(items) + cls.PAGE_SIZE - 1) // cls.PAGE_SIZE
+            for number in range(1, count+1):
+                chunk = items[(number-1) * cls.PAGE_SIZE : number * cls.PAGE_SIZE]
+                result.append(cls(app, value, slug, chunk, number, count))
+        return result
+
+    @classmethod
+    def path_for(cls, app, page_class, field, value):
+        """
+        Return the path (from the site root) of the first page of the
+        archive for a value of a field of a class of pages.
+        """
+        for archive_class in ARCHIVE_CLASSES:
+            if (archive_class.PAGE_CLASS is page_class) and \
+               (archive_class.FIELD == field):
+                slug = archive_class._slug(app, value)
+                return archive_class._page_filename(slug, 1)
+        assert False, \
+               'No archive for %s.%s' % (page_class.__name__, field)
+
+    @classmethod
+    def _index(cls, pages):
+        """
+        Build an inverted index mapping each value of FIELD to the
+        pages that have it (in the order given) in a single pass, so
+        that the cost grows linearly with the number of pages.
+        """
+        result = {}
+        for page in pages:
+            values = getattr(page, cls.FIELD)
+            if not values:
+                continue
+            if isinstance(values, STRING_TYPES):
+                values = [values]
+            for value in values:
+                if value not in result:
+                    result[value] = []
+                result[value].append(page)
+        return result
+
+    @classmethod
+    def _slug(cls, app, value):
+        """
+        Name an archive after the ID its value was translated from (if
+        there is one) or a cleaned-up version of the value itself.
+        """
+        ids = app.metadata_ids.get(cls.METADATA, {})
+        if value in ids:
+            return ids[value]
+        return ARCHIVE_SLUG_PATTERN.sub('-', value.lower()).strip('-')
+
+    @classmethod
+    def _page_filename(cls, slug, number):
+        """
+        Construct the filename of one page of an archive.
+        """
+        if number == 1:
+            return '%s/%s.html' % (cls.DIRECTORY, slug)
+        return '%s/%s-%d.html' % (cls.DIRECTORY, slug, number)
+
+
+class CategoryArchivePage(ArchivePage):
+    """
+    Blog posts in a category.
+    """
+
+    PAGE_CLASS = BlogPostPage
+    FIELD = 'category'
+    METADATA = 'category'
+    DIRECTORY = 'blog/category'
+    INDEX = BLOG_INDEX
+    TITLE = 'Posts in %s'
+    TEMPLATE = 'blog/_archive.html'
+
+    __slots__ = []
+
+
+class AuthorArchivePage(ArchivePage):
+    """
+    Blog posts by an author.
+    """
+
+    PAGE_CLASS = BlogPostPage
+    FIELD = 'author_id'
+    METADATA = 'author_id'
+    DIRECTORY = 'blog/author'
+    INDEX = BLOG_INDEX
+    TITLE = 'Posts by %s'
+    TEMPLATE = 'blog/_archive.html'
+
+    __slots__ = []
+
+
+class InstructorArchivePage(ArchivePage):
+    """
+    Boot camps taught by an instructor.
+    """
+
+    PAGE_CLASS = BootCampPage
+    FIELD = 'instructors'
+    METADATA = 'author_id'
+    DIRECTORY = 'bootcamps/instructor'
+    INDEX = BOOTCAMP_INDEX
+    TITLE = 'Boot Camps Taught by %s'
+    TEMPLATE = 'bootcamps/_archive.html'
+
+    __slots__ = []
+
+
+ARCHIVE_CLASSES = [CategoryArchivePage, AuthorArchivePage, InstructorArchivePage]
+
+#----------------------------------------
+
 class PageFactory(object):
     """
     Construct the right kind of page object for a page by finding a
     pageclass comment in the page or its parent(s) and looking up the
     corresponding class in this script.  Page class mappings are
     cached to avoid repeatedly reading the same handful of generic
-    (base) Jinja2 templates.
+    (base) Jinja2 templates.  The factory also keeps track of the pages
+    it has created, by class, so that they can be used to render feeds
+    and archives; reset() starts over for another build, keeping pages
+    that can be reused.
     """
 
     PAGE_CLASS_PAT = re.compile(r'<!--\s+pageclass:\s+\b(.+)\b\s+-->')
     EXTENDS_PAT = re.compile(r'{%\s*extends\s+"([^"]+)"\s*%}')
+    TEMPLATE_REF_PAT = re.compile(r'{%-?\s*(?:extends|include|import|from)\s+"([^"]+)"')
 
     def __init__(self, app):
         self.app = app
         self.cache = {}
+        self.deps_cache = {}
+        self.instances = {}
+        self.reusable = {}
 
     def __call__(self, filename, original, parent):
         """
-        Make a page object based on metadata embedded in the page itself.
+        Make a page object based on metadata embedded in the page itself
+        (or reuse one made for an earlier build).
         """
-        with open(filename, 'r') as reader:
-            cls = self._find_page_class(filename)
+        page = self.reusable.pop((filename, original), None)
+        if page is not None:
+            page.parent = parent
+        else:
+            with self.app.profiler.phase('resolve_class', filename):
+                cls = self._find_page_class(filename)
             assert cls in globals(), \
                    'Unknown page class %s' % cls
-            return globals()[cls](self.app, self, filename, original, parent)
+            page = globals()[cls](self.app, self, filename, original, parent)
+        self.instances.setdefault(page.__class__, []).append(page)
+        return page
+
+    def created(self, page_class):
+        """
+        Return the pages of a class created since the factory was
+        created or reset, in the order they were created.
+        """
+        return self.instances.get(page_class, [])
+
+    def reset(self, changed=()):
+        """
+        Get ready to load the page tree again (in watch mode) after
+        some files have changed.  Pages without children whose files
+        haven't changed are kept for reuse, unless the metadata file
+        or a template that page classes are found through has changed
+        (in which case every page must be made again).  Pages with
+        children are always made again, since pages may have been
+        added or removed.  The dependencies of templates that are, or
+        depend on, files that have changed are forgotten.
+        """
+        changed = set(os.path.normpath(f) for f in changed)
+        pages = [p for group in self.instances.values() for p in group]
+        shared = set(os.path.normpath(f) for f in self.cache)
+        shared.difference_update(os.path.normpath(p.filename) for p in pages)
+        if self.app.metadata_filename is not None:
+            shared.add(os.path.normpath(self.app.metadata_filename))
+
+        self.reusable = {}
+        if changed.isdisjoint(shared):
+            for page in pages:
+                if (not page.subfile) and (not page.subglob) and \
+                   (os.path.normpath(page.filename) not in changed):
+                    self.reusable[(page.filename, page.original)] = page
+            for filename in list(self.cache):
+                if os.path.normpath(filename) in changed:
+                    del self.cache[filename]
+        else:
+            self.cache = {}
+        self.instances = {}
+
+        for (filename, deps) in list(self.deps_cache.items()):
+            if (os.path.normpath(filename) in changed) or \
+               any(os.path.normpath(d) in changed for d in deps):
+                del self.deps_cache[filename]
 
     def _find_page_class(self, original_filename):
         """
@@ -757,41 +1484,568 @@ class PageFactory(object):
         if filename in self.cache:
             return self.cache[filename]
 
-        with open(filename, 'r') as reader:
+        # Explicit page class declaration in this page.
+        declared, base_filename = self._declarations(filename)
+        if declared:
+            cls = declared
+            self.cache[filename] = cls
+            return cls
 
-            # Explicit page class declaration in this page.
-            data = reader.read()
-            m = self.PAGE_CLASS_PAT.search(data)
-            if m:
-                cls = m.group(1)
-                self.cache[filename] = cls
-                return cls
+        # This page extends something else.
+        if base_filename:
+            cls = self._find_page_class(base_filename)
+            self.cache[filename] = cls
+            return cls
+
+        # No page class.
+        assert False, \
+               'Unable to find page class for %s' % filename
+
+    def _declarations(self, filename):
+        """
+        Return the page class declared in a file and the template it
+        extends (either of which may be None), using the metadata
+        index if the file hasn't changed since it was indexed.
+        """
+        row = self.app.metaindex.lookup(filename)
+        if (row is not None) and row['classified']:
+            return (row['pageclass'], row['base'])
 
-            # This page extends something else.
+        data = self.app.sources.read(filename)
+        declared, base = None, None
+        m = self.PAGE_CLASS_PAT.search(data)
+        if m:
+            declared = m.group(1)
+        else:
             m = self.EXTENDS_PAT.search(data)
             if m:
-                base_filename = m.group(1)
-                cls = self._find_page_class(base_filename)
-                self.cache[filename] = cls
-                return cls
+                base = m.group(1)
+        self.app.metaindex.classify(filename, declared, base)
+        return (declared, base)
 
-            # No page class.
-            assert False, \
-                   'Unable to find page class for %s' % filename
+    def dependencies(self, filename):
+        """
+        Return the set of template files that a page or template pulls
+        in via extends, include, or import, directly or indirectly.
+        References that can't be found are left for Jinja2 to report.
+        """
+        if filename in self.deps_cache:
+            return self.deps_cache[filename]
+
+        # Guard against include cycles while we recurse.
+        result = set()
+        self.deps_cache[filename] = result
+
+        data = self.app.sources.read(filename)
+        for name in self.TEMPLATE_REF_PAT.findall(data):
+            path = self.app.sources.find(name)
+            if path is not None:
+                result.add(path)
+                result.update(self.dependencies(path))
+        return result
+
+    def inputs(self, page):
+        """
+        Return the sorted list of files a page's rendering depends on:
+        its template and everything that pulls in, its children's
+        source files, and the metadata file.
+        """
+        template = page.template_name()
+        result = set([template])
+        result.update(self.dependencies(template))
+        result.update(child.filename for child in page.children)
+        if self.app.metadata_filename is not None:
+            result.add(self.app.metadata_filename)
+        return sorted(result)
 
     def _find_file(self, filename):
         """
-        Search for a file in various directories by name.  This
-        duplicates the machinery inside Jinja2 for finding template
-        pages that are being extended, but there's no easy way to get
-        Jinja2 to do the finding for us.
+        Search for a file in various directories by name.  This is
+        the same lookup SourceStoreLoader does for Jinja2, so pages
+        that are being extended are found the same way in both places.
         """
-        for d in self.app.search_path:
-            f = os.path.join(d, filename)
-            if os.path.isfile(f):
-                return f
-        assert False, \
+        f = self.app.sources.find(filename)
+        assert f is not None, \
                'File %s not found in search path %s' % (filename, self.app.search_path)
+        return f
+
+#----------------------------------------
+
+class DependencyGraph(object):
+    """
+    Record what each rendered page depends on so that later builds
+    only re-render pages whose inputs have changed.  A page's inputs
+    are its own source file (or the template it is generated from),
+    the templates that extends, includes, or imports, the source files
+    of its children (whose metadata index pages display), and the
+    metadata file.  The signature of a page
+    also covers the things its parent decides for it (previous/next
+    links) and the command-line settings shared by every page.  The
+    graph is saved as JSON in the build cache directory.  If there is
+    no cache directory, it is only kept in memory between the builds
+    of watch mode; otherwise, every page is always rendered.
+    """
+
+    FILENAME = 'depgraph.json'
+    VERSION = 1
+
+    def __init__(self, app, factory):
+        self.app = app
+        self.factory = factory
+        self.old = {}
+        self.new = {}
+        self.stats = {}
+        self.filename = None
+        self.enabled = app.watch
+        if app.cache_dir is not None:
+            self.filename = os.path.join(app.cache_dir, self.FILENAME)
+            self.enabled = True
+            self._load()
+
+    def is_stale(self, page):
+        """
+        Does this page need to be rendered?
+        """
+        if not self.enabled:
+            return True
+        dest = os.path.join(self.app.output_dir, page.filename)
+        entry = self.old.get(page.filename)
+        if (entry is None) or (not os.path.isfile(dest)):
+            return True
+        if (self.app.links is not None) and (not self.app.links.knows(dest)):
+            return True
+        if entry['signature'] != self._signature(page):
+            return True
+        self.new[page.filename] = entry
+        return False
+
+    def record(self, page):
+        """
+        Remember the inputs of a page that has just been rendered.
+        """
+        if not self.enabled:
+            return
+        self.new[page.filename] = {'deps' : self.inputs(page),
+                                   'signature' : self._signature(page)}
+
+    def inputs(self, page):
+        """
+        Return the sorted list of files a page's rendering depends on.
+        """
+        return self.factory.inputs(page)
+
+    def dependents(self, filename):
+        """
+        Return the pages that depended on a file in the last build.
+        """
+        return sorted(p for (p, entry) in self.old.items()
+                      if filename in entry['deps'])
+
+    def save(self):
+        """
+        Write the graph for the next build to use.  Pages that weren't
+        seen in this build are dropped, unless this was a partial build
+        (which only sees a few pages), and their output files are
+        removed (e.g., when a blog post has been deleted, or an archive
+        has fewer pages than it used to).
+        """
+        if not self.enabled:
+            return
+        pages = dict(self.old) if self.app.only else {}
+        pages.update(self.new)
+        for filename in sorted(set(self.old) - set(pages)):
+            self.app.writer.remove(os.path.join(self.app.output_dir, filename))
+        self.old, self.new, self.stats = pages, {}, {}
+        if self.filename is None:
+            return
+        if not os.path.isdir(self.app.cache_dir):
+            os.makedirs(self.app.cache_dir)
+        # (json.dumps is much faster than json.dump, and indenting
+        # would prevent it from using its C encoder.)
+        text = json.dumps({'version' : self.VERSION, 'pages' : pages},
+                          sort_keys=True)
+        with open(self.filename, 'w') as writer:
+            writer.write(text)
+
+    def _load(self):
+        """
+        Load the graph saved by the previous build (if any).
+        """
+        if not os.path.isfile(self.filename):
+            return
+        with open(self.filename, 'r') as reader:
+            data = json.load(reader)
+        if data.get('version') == self.VERSION:
+            self.old = data['pages']
+
+    def _signature(self, page):
+        """
+        Summarize everything that determines a page's output.
+        """
+        parts = [self.app.settings(), page.filename,
+                 page.uplink, getattr(page, 'prev', None),
+                 getattr(page, 'next', None),
+                 [child.filename for child in page.children]]
+        parts.extend(self._stat(f) for f in self.inputs(page))
+        return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def _stat(self, filename):
+        """
+        Return (filename, modification time, size), caching the result
+        since templates are shared by many pages.
+        """
+        if filename not in self.stats:
+            st = os.stat(filename)
+            self.stats[filename] = [filename, st.st_mtime, st.st_size]
+        return self.stats[filename]
+
+#----------------------------------------
+
+class OutputWriter(object):
+    """
+    Save generated files.  A file is only written if its contents have
+    changed, so that unchanged output keeps its modification time and
+    deployment tools only have to move what actually changed.  Changed
+    files are written to a temporary file in the same directory and
+    then renamed into place, so a half-written page is never visible.
+    Hashes of everything written are kept in the build cache directory
+    (if there is one) so unchanged output can be recognized without
+    reading it back.  At the end of each build, a manifest of the
+    output directory (the path and hash of every file this build knows
+    about) is written there for bin/publish.py.
+    """
+
+    FILENAME = 'outputs.json'
+    MANIFEST = '.manifest.json'
+
+    def __init__(self, app):
+        self.app = app
+        self.old = {}
+        self.new = {}
+        self.filename = None
+        if app.cache_dir is not None:
+            self.filename = os.path.join(app.cache_dir, self.FILENAME)
+            self._load()
+
+        # mkstemp creates files readable only by their owner, but the
+        # web server needs to read what we write.
+        umask = os.umask(0)
+        os.umask(umask)
+        self.mode = 0o666 & ~umask
+
+    def write(self, dest, text):
+        """
+        Save text (or bytes) to a file if it differs from what's
+        there already, returning the SHA-1 hash of the contents.
+        """
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        digest = hashlib.sha1(text).hexdigest()
+        key = os.path.abspath(dest)
+        self.new[key] = digest
+        if not self._unchanged(key, text, digest):
+            self._replace(key, text)
+        return digest
+
+    def record(self, dest, digest):
+        """
+        Remember the hash of a file written by another process.
+        """
+        self.new[os.path.abspath(dest)] = digest
+
+    def remove(self, dest):
+        """
+        Delete an output file that is no longer generated, and forget
+        it (so that it leaves the manifest too).
+        """
+        key = os.path.abspath(dest)
+        self.old.pop(key, None)
+        self.new.pop(key, None)
+        if os.path.isfile(key):
+            os.unlink(key)
+
+    def save(self):
+        """
+        Save the hashes of all output files for the next build, and
+        write the output directory's manifest.  Files that weren't
+        written this time but still exist (e.g., pages skipped because
+        they were up to date) keep their old hashes.
+        """
+        hashes = dict((path, digest) for (path, digest) in self.old.items()
+                      if os.path.isfile(path))
+        hashes.update(self.new)
+        self._save_manifest(hashes)
+        self.old, self.new = hashes, {}
+        if self.filename is None:
+            return
+        if not os.path.isdir(self.app.cache_dir):
+            os.makedirs(self.app.cache_dir)
+        text = json.dumps(hashes, sort_keys=True)
+        with open(self.filename, 'w') as writer:
+            writer.write(text)
+
+    def _save_manifest(self, hashes):
+        """
+        Write the manifest of the output directory: the hashes of the
+        generated files inside it and of the static files published
+        there, keyed by path relative to the output directory.
+        """
+        root = os.path.abspath(self.app.output_dir)
+        prefix = root + os.sep
+        manifest = {}
+        for (path, digest) in hashes.items():
+            if path.startswith(prefix):
+                manifest[path[len(prefix):]] = digest
+        if self.app.assets is not None:
+            manifest.update(self.app.assets.hashes())
+        text = json.dumps(manifest, indent=1, sort_keys=True)
+        self._replace(os.path.join(root, self.MANIFEST), text.encode('utf-8'))
+
+    def _replace(self, path, text):
+        """
+        Write bytes beside the destination, then rename over it.
+        """
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temp = tempfile.mkstemp(dir=directory,
+                                    prefix='.' + os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'wb') as writer:
+                writer.write(text)
+            os.chmod(temp, self.mode)
+            replace(temp, path)
+        except:
+            os.unlink(temp)
+            raise
+
+    def _unchanged(self, path, text, digest):
+        """
+        Is the file at 'path' already identical to 'text'?  Use the
+        stored hash if there is one, or compare the bytes on disk.
+        """
+        if not os.path.isfile(path):
+            return False
+        if os.path.getsize(path) != len(text):
+            return False
+        if path in self.old:
+            return self.old[path] == digest
+        with open(path, 'rb') as reader:
+            return reader.read() == text
+
+    def _load(self):
+        """
+        Load the hashes saved by the previous build (if any).
+        """
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'r') as reader:
+                self.old = json.load(reader)
+
+#----------------------------------------
+
+class LinkChecker(object):
+    """
+    Check the links in rendered pages (--check-links) without reading
+    the output back in: the hrefs and anchors in each page are picked
+    out of its text as it is rendered, and at the end of the build the
+    hrefs are normalized the way bin/links.py does it and looked up
+    among the files in the output directory (and, if static files
+    aren't being published, the static files in the source tree), and
+    links to fragments of pages are checked against those pages'
+    anchors.  What was found in each page is kept in the build cache
+    directory, so pages that weren't rendered because they hadn't
+    changed are still checked.
+    """
+
+    FILENAME = 'hrefs.json'
+    VERSION = 2
+
+    def __init__(self, app):
+        self.app = app
+        self.old = {}
+        self.new = {}
+        self.filename = None
+        if app.cache_dir is not None:
+            self.filename = os.path.join(app.cache_dir, self.FILENAME)
+            self._load()
+
+    def add(self, dest, text):
+        """
+        Record the hrefs and anchors in a page that has just been
+        rendered.
+        """
+        self.new[os.path.abspath(dest)] = {'hrefs' : find_hrefs(text),
+                                           'ids' : find_ids(text)}
+
+    def knows(self, dest):
+        """
+        Was what is in a page recorded by an earlier build?  (If not,
+        e.g. because that build didn't check links, the page has to be
+        rendered again even if it hasn't changed.)
+        """
+        return os.path.abspath(dest) in self.old
+
+    def take(self):
+        """
+        Return and forget what has been recorded so far (so that
+        worker processes can hand it back to the parent).
+        """
+        result = self.new
+        self.new = {}
+        return result
+
+    def collect(self, found):
+        """
+        Add what was recorded by another process.
+        """
+        self.new.update(found)
+
+    def check(self):
+        """
+        Return the sorted (page, normalized, raw) links in all the
+        pages in the output directory that don't lead anywhere,
+        followed by those that lead to missing anchors.
+        """
+        # The build cache directory may be shared by several output
+        # directories: only pages in this one are checked, but what
+        # was found in the others is kept for their next builds.
+        root = os.path.abspath(self.app.output_dir)
+        prefix = root + os.sep
+        others = dict((path, found) for (path, found) in self.old.items()
+                      if not path.startswith(prefix))
+        pages = dict((path, found) for (path, found) in self.old.items()
+                     if path.startswith(prefix) and os.path.isfile(path))
+        pages.update(self.new)
+        others.update(pages)
+        self.old, self.new = others, {}
+
+        present = set()
+        for (dirpath, dirnames, filenames) in os.walk(root):
+            present.update(os.path.join(dirpath, f) for f in filenames)
+        if self.app.assets is None:
+            for pattern in ASSET_PATTERNS:
+                present.update(os.path.join(root, os.path.normpath(f))
+                               for f in glob.glob(pattern))
+
+        # Pages in the same directory mostly share links, so each link
+        # is only normalized once per directory.
+        targets = {}
+        missing = set()
+        for (page, found) in pages.items():
+            directory = os.path.dirname(page)
+            for raw in set(found['hrefs']):
+                key = (directory, raw)
+                if key not in targets:
+                    link = normalize(root, page, raw)
+                    targets[key] = None if (link is None) else link[1]
+                if (targets[key] is not None) and (targets[key] not in present):
+                    missing.add((page, targets[key], raw))
+        return sorted(missing) + missing_anchors(root, pages)
+
+    def save(self):
+        """
+        Save what was found in every page for the next build.
+        """
+        if self.filename is None:
+            return
+        if not os.path.isdir(self.app.cache_dir):
+            os.makedirs(self.app.cache_dir)
+        text = json.dumps({'version' : self.VERSION, 'pages' : self.old},
+                          sort_keys=True)
+        with open(self.filename, 'w') as writer:
+            writer.write(text)
+
+    def _load(self):
+        """
+        Load what was found in pages by the previous build (if any).
+        """
+        if not os.path.isfile(self.filename):
+            return
+        with open(self.filename, 'r') as reader:
+            data = json.load(reader)
+        if data.get('version') == self.VERSION:
+            self.old = data['pages']
+
+#----------------------------------------
+
+class Profiler(object):
+    """
+    Record how long each phase of the build takes for each page.  The
+    results are saved as Chrome trace events (load the file in
+    chrome://tracing or Perfetto to see them on a timeline), and a
+    summary of the time spent in each phase and the slowest pages is
+    printed at the end of the build.  If no file is given, phases
+    aren't timed at all.
+    """
+
+    SUMMARY_LENGTH = 10
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = []
+        self.start = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name, filename=None):
+        """
+        Time the body of a 'with' statement as one phase of the build
+        (for a particular page, if a filename is given).
+        """
+        if self.filename is None:
+            yield
+            return
+        begin = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self.events.append({'name' : name,
+                                'cat'  : 'build',
+                                'ph'   : 'X',
+                                'ts'   : int((begin - self.start) * 1e6),
+                                'dur'  : int((end - begin) * 1e6),
+                                'pid'  : os.getpid(),
+                                'tid'  : 0,
+                                'args' : {'page' : filename}})
+
+    def take(self):
+        """
+        Return and forget the events recorded so far (so that worker
+        processes can hand them back to the parent).
+        """
+        result, self.events = self.events, []
+        return result
+
+    def collect(self, events):
+        """
+        Add events recorded by another process.
+        """
+        self.events.extend(events)
+
+    def save(self):
+        """
+        Write the trace file and show a summary on standard error.
+        """
+        if self.filename is None:
+            return
+        with open(self.filename, 'w') as writer:
+            json.dump({'traceEvents' : self.events,
+                       'displayTimeUnit' : 'ms'}, writer)
+
+        phases, pages = {}, {}
+        for e in self.events:
+            phases[e['name']] = phases.get(e['name'], 0) + e['dur']
+            page = e['args']['page']
+            if page is not None:
+                pages[page] = pages.get(page, 0) + e['dur']
+
+        sys.stderr.write('time by phase (ms):\n')
+        for (name, dur) in sorted(phases.items(), key=lambda x: -x[1]):
+            sys.stderr.write('%10.1f  %s\n' % (dur / 1e3, name))
+        sys.stderr.write('slowest pages (ms):\n')
+        slowest = sorted(pages.items(), key=lambda x: -x[1])
+        for (page, dur) in slowest[:self.SUMMARY_LENGTH]:
+            sys.stderr.write('%10.1f  %s\n' % (dur / 1e3, page))
 
 #----------------------------------------
 
@@ -829,6 +2083,10 @@ class ICalendarWriter(object):
     The format is defined in RFC 5545: http://tools.ietf.org/html/rfc5545
     """
 
+    def __init__(self, writer, stamp):
+        self.writer = writer
+        self.stamp = stamp
+
     def __call__(self, filename, site, bootcamps):
         lines = [
             'BEGIN:VCALENDAR',
@@ -841,8 +2099,7 @@ class ICalendarWriter(object):
         content = '\r\n'.join(lines)
         # From RFC 5545, section 3.1.4 (Character Set):
         # The default charset for an iCalendar stream is UTF-8.
-        with open(filename, 'wb') as writer:
-            writer.write(content.encode('utf-8'))
+        self.writer.write(filename, content.encode('utf-8'))
 
     def bootcamp(self, site, bootcamp):
         uid = '{0}@{1}'.format(bootcamp.link().replace('.html', ''),
@@ -857,7 +2114,7 @@ class ICalendarWriter(object):
         lines = [
             'BEGIN:VEVENT',
             'UID:{0}'.format(uid),
-            'DTSTAMP:{0}'.format(timestamp()),
+            'DTSTAMP:{0}'.format(self.stamp),
             'DTSTART;VALUE=DATE:{0}'.format(bootcamp.startdate.replace('-', '')),
             'DTEND;VALUE=DATE:{0}'.format(dtend.strftime('%Y%m%d')),
             'SUMMARY:{0}'.format(self.escape(bootcamp.venue)),
@@ -882,7 +2139,285 @@ class ICalendarWriter(object):
 
 #----------------------------------------
 
-def create_rss(filename, site, posts):
+class MemoryWriter(object):
+    """
+    Stand-in for OutputWriter that keeps what would have been written
+    in memory (e.g., feeds generated for the development server).
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def write(self, dest, text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self.files[dest] = text
+        return hashlib.sha1(text).hexdigest()
+
+#----------------------------------------
+
+class PageServer(object):
+    """
+    Produce responses for the development server (--serve), rendering
+    pages only when they are asked for.  A request for a page loads
+    just the part of the page tree leading to it (as a partial build
+    does), renders the page in memory, and keeps the result until one
+    of the files it was made from changes: the page's own inputs, its
+    parent's (whose children decide its previous and next links), and
+    the directories that either of them globs (so that added and
+    deleted pages are noticed).  Archive pages, the blog feed, and the
+    iCalendar file are made the same way from the page that indexes
+    their pages.  Static files are read from the search path; anything
+    else (e.g., the search index) is looked for in the output
+    directory, in case an earlier build left it there.
+    Responses are dictionaries with 'body', 'type', and 'etag' keys.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.cache = {}
+        self.metadata_stamp = self._stamp_file(app.metadata_filename)
+        self.generated = {}
+        for (filename, method) in ((app.blog_filename, self._feed),
+                                   (app.icalendar_filename, self._calendar)):
+            if filename is not None:
+                path = os.path.relpath(filename, app.output_dir)
+                if not path.startswith(os.pardir):
+                    self.generated[os.path.normpath(path)] = method
+
+    def get(self, path):
+        """
+        Return the response for a path (relative to the site's root),
+        or None if there is nothing there.
+        """
+        self.app.metaindex.refresh()
+        stamp = self._stamp_file(self.app.metadata_filename)
+        if stamp != self.metadata_stamp:
+            self.app.refresh([self.app.metadata_filename])
+            self.metadata_stamp = stamp
+
+        entry = self.cache.get(path)
+        if (entry is not None) and \
+           (entry['stamp'] == self._stamp(entry['files'], entry['dirs'])):
+            return entry
+        self.cache.pop(path, None)
+        entry = self._make(path)
+        if (entry is not None) and ('stamp' in entry):
+            self.cache[path] = entry
+        return entry
+
+    def compressed(self, entry):
+        """
+        Return the gzipped body of a response (compressing it once for
+        rendered pages, which stay in the cache).
+        """
+        if 'gzip' not in entry:
+            entry['gzip'] = gzip_bytes(entry['body'])
+        return entry['gzip']
+
+    def _make(self, path):
+        """
+        Produce a response that isn't in the cache.
+        """
+        if path in self.generated:
+            return self.generated[path](path)
+        for cls in ARCHIVE_CLASSES:
+            if path.startswith(cls.DIRECTORY + '/'):
+                return self._archive(cls, path)
+        if any(fnmatch.fnmatch(path, pattern) for pattern in ASSET_PATTERNS):
+            source = self.app.sources.find(path)
+            if source is not None:
+                return self._file(source)
+        if path.endswith('.html') and os.path.isfile(path):
+            return self._page(path)
+        output = os.path.join(self.app.output_dir, path)
+        if os.path.isfile(output):
+            return self._file(output)
+        return None
+
+    def _load(self, target):
+        """
+        Load as much of the page tree as is needed to render one page,
+        returning the factory that made them and the pages.
+        """
+        self.app.only = [os.path.normpath(target)]
+        factory = PageFactory(self.app)
+        return factory, load_pages(self.app, factory)
+
+    def _page(self, path):
+        """
+        Render an ordinary page (if it can be reached).
+        """
+        factory, pages = self._load(path)
+        for page in pages:
+            if os.path.normpath(page.filename) == path:
+                context = [page] if (page.parent is None) else [page, page.parent]
+                return self._entry(path, page.expand(), factory, context)
+        return None
+
+    def _archive(self, cls, path):
+        """
+        Render one page of an archive.
+        """
+        factory, pages = self._load(cls.INDEX)
+        index = [p for p in pages if os.path.normpath(p.filename) == cls.INDEX]
+        for archive in cls.create(self.app, factory.created(cls.PAGE_CLASS)):
+            if archive.filename == path:
+                return self._entry(path, archive.expand(), factory,
+                                   [archive] + index)
+        return None
+
+    def _feed(self, path):
+        """
+        Generate the blog's RSS feed.
+        """
+        factory, pages = self._load(BLOG_INDEX)
+        writer = MemoryWriter()
+        create_rss(writer, self.app.blog_filename, self.app.site,
+                   factory.created(BlogPostPage), self.app.build_datetime())
+        return self._entry(path, writer.files[self.app.blog_filename], factory,
+                           [p for p in pages if p.filename == BLOG_INDEX])
+
+    def _calendar(self, path):
+        """
+        Generate the boot camp iCalendar file.
+        """
+        factory, pages = self._load(BOOTCAMP_INDEX)
+        writer = MemoryWriter()
+        icw = ICalendarWriter(writer, self.app.timestamp())
+        icw(self.app.icalendar_filename, self.app.site, factory.created(BootCampPage))
+        return self._entry(path, writer.files[self.app.icalendar_filename], factory,
+                           [p for p in pages if p.filename == BOOTCAMP_INDEX])
+
+    def _entry(self, path, text, factory, context):
+        """
+        Make a cacheable response for something rendered from the
+        pages in 'context'.
+        """
+        files, dirs = set(), set()
+        for page in context:
+            files.update(factory.inputs(page))
+            for pattern in getattr(page, 'subglob', None) or []:
+                dirs.update(glob_directories(os.path.join(page._directory, pattern)))
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        files, dirs = sorted(files), sorted(dirs)
+        return {'body' : text,
+                'type' : content_type(path),
+                'etag' : '"%s"' % hashlib.sha1(text).hexdigest(),
+                'files' : files,
+                'dirs' : dirs,
+                'stamp' : self._stamp(files, dirs)}
+
+    def _file(self, filename):
+        """
+        Make a response for a file that is sent as it is.  These aren't
+        cached, but their tags come from their modification times and
+        sizes, so they can be revalidated cheaply.
+        """
+        st = os.stat(filename)
+        with open(filename, 'rb') as reader:
+            body = reader.read()
+        return {'body' : body,
+                'type' : content_type(filename),
+                'etag' : '"%x-%x"' % (int(st.st_mtime * 1e6), st.st_size)}
+
+    def _stamp(self, files, dirs):
+        """
+        Return the modification times and sizes of a response's inputs
+        (and the modification times of the directories searched for
+        them, which change when files are added or removed).
+        """
+        return [self._stamp_file(f) for f in files] + \
+               [self._stamp_file(d) for d in dirs]
+
+    def _stamp_file(self, filename):
+        """
+        Return a file's modification time and size, or None if it
+        doesn't exist (or no file is given).
+        """
+        if filename is None:
+            return None
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+#----------------------------------------
+
+class PageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answer GET and HEAD requests from the server's PageServer, with
+    conditional requests (ETag and If-None-Match) and gzip.  Browsers
+    are told to check back every time (which costs them a 304 if
+    nothing has changed), so edits show up on reload.
+    """
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def _respond(self, send_body):
+        url_path = unquote(urlparse(self.path).path)
+        path = os.path.normpath(url_path.lstrip('/')) if url_path.strip('/') else ''
+        if path.startswith(os.pardir) or os.path.isabs(path):
+            self.send_error(404)
+            return
+        if (not path) or url_path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        elif os.path.isdir(path):
+            self.send_response(301)
+            self.send_header('Location', url_path + '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        try:
+            entry = self.server.pages.get(path)
+        except Exception:
+            body = traceback.format_exc().encode('utf-8')
+            sys.stderr.write(body.decode('utf-8'))
+            self._send(500, body, 'text/plain; charset=utf-8', None, None, send_body)
+            return
+        if entry is None:
+            self.send_error(404)
+            return
+
+        body, etag, encoding = entry['body'], entry['etag'], None
+        if path.endswith(COMPRESSIBLE) and (len(body) >= MIN_COMPRESS_SIZE) and \
+           ('gzip' in self.headers.get('Accept-Encoding', '')):
+            body, encoding = self.server.pages.compressed(entry), 'gzip'
+            etag = etag[:-1] + '-gzip"'
+        wanted = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        if (etag in wanted) or ('*' in wanted):
+            self._send(304, b'', None, etag, None, False)
+            return
+        self._send(200, body, entry['type'], etag, encoding, send_body)
+
+    def _send(self, status, body, mime_type, etag, encoding, send_body):
+        """
+        Send a response's headers, and its body if asked to.
+        """
+        self.send_response(status)
+        if mime_type is not None:
+            self.send_header('Content-Type', mime_type)
+            self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+#----------------------------------------
+
+def create_rss(writer, filename, site, posts, build_time):
     """
     Generate RSS2 feed.xml file for blog.
     """
@@ -895,22 +2430,178 @@ def create_rss(filename, site, posts):
         template_vars = post.app.standard(post.filename)
         template_vars['root_path'] = site
         path = os.path.join(site, 'blog', post.index_link())
-        rendered_content = jinja2.Template(post.content).render(**template_vars)
+        rendered_content = post.render_content(page=post, **template_vars)
         items.append(ContentEncodedRSSItem(title=post.title,
                              author=post.author_id,
                              link=path,
-                             description=post.excerpt(filename),
+                             description=post.excerpt(post.filename, site),
                              content=rendered_content,
                              pubDate=post.post_date))
 
     rss = ContentEncodedRSS2(title=BLOG_TITLE,
                link=site,
                description=BLOG_DESCRIPTION,
-               lastBuildDate=datetime.datetime.utcnow(),
+               lastBuildDate=build_time,
                items=items)
 
-    with open(filename, 'w') as writer:
-        rss.write_xml(writer)
+    writer.write(filename, rss.to_xml())
+
+#----------------------------------------
+
+# Pages being rendered by worker processes.  Forked workers inherit
+# this from the parent; workers that can't fork rebuild it themselves.
+_RENDER_PAGES = None
+
+def load_pages(app, factory):
+    """
+    Create page objects for each initial file (recursively), returning
+    all pages in rendering order.
+    """
+    pages = []
+    for filename in app.filenames:
+        root = factory(filename, filename, None)
+        pages.extend(root.walk())
+    return pages
+
+def create_archives(app, factory, archive_classes):
+    """
+    Create and return the pages of the given kinds of archives (from
+    the pages the factory has created, so load_pages must be called
+    first).
+    """
+    result = []
+    for archive_class in archive_classes:
+        result.extend(archive_class.create(app, factory.created(archive_class.PAGE_CLASS)))
+    return result
+
+def create_search_index(app, pages):
+    """
+    Write the client-side search index for all searchable pages.
+    Each page's terms are remembered in the build cache directory, so
+    only pages that have changed are read and tokenized again.  The
+    index is kept by the application, so later builds in watch mode
+    don't have to load it again.
+    """
+    if app.search_index is None:
+        filename = None
+        if app.cache_dir is not None:
+            filename = os.path.join(app.cache_dir, SEARCH_CACHE_FILE)
+        app.search_index = SearchIndex(filename)
+    index = app.search_index
+    for page in pages:
+        if page.SEARCHABLE:
+            st = os.stat(page.filename)
+            index.add(page.filename, page.filename, page.title,
+                      getattr(page, 'post_date', None),
+                      [st.st_mtime, st.st_size], page.search_text)
+    index.write(app.writer, app.search_dir)
+
+def select_partial(app, pages):
+    """
+    Return the pages to render in a partial (--only) build: the pages
+    asked for and their parents (which may index them), in rendering
+    order.
+    """
+    targets = [p for p in pages if os.path.normpath(p.filename) in app.only]
+    missing = set(app.only) - set(os.path.normpath(p.filename) for p in targets)
+    assert not missing, \
+           'Pages not reachable from %s: %s' % \
+           (', '.join(app.filenames), ', '.join(sorted(missing)))
+    wanted = set(id(p) for p in targets)
+    wanted.update(id(p.parent) for p in targets if p.parent is not None)
+    return [p for p in pages if id(p) in wanted]
+
+def render_pages(app, pages, selected, archive_classes=()):
+    """
+    Render the selected pages, spreading the work across app.jobs
+    processes.  'pages' are the pages loaded from the page tree,
+    followed by the pages of the given kinds of archives.  The page
+    tree isn't picklable (it holds the Jinja2 environment), so workers
+    are forked after the tree has been built and are told which pages
+    to render by position in 'pages'.  Where fork isn't available,
+    each worker rebuilds the tree (and the archives) from the
+    command-line arguments instead, which produces the same pages in
+    the same order.
+    """
+    global _RENDER_PAGES
+    if (app.jobs == 1) or (len(selected) < 2):
+        for page in selected:
+            page._render()
+        return
+
+    try:
+        context = multiprocessing.get_context('fork')
+        initargs = (None,)
+    except AttributeError:  # Python 2 always forks on Unix
+        context = multiprocessing
+        initargs = (None,)
+    except ValueError:  # no fork on this platform
+        context = multiprocessing.get_context('spawn')
+        initargs = ((app.args, [c.__name__ for c in archive_classes]),)
+
+    position = dict((id(page), i) for (i, page) in enumerate(pages))
+    indices = [position[id(page)] for page in selected]
+    chunksize = max(1, len(indices) // (4 * app.jobs))
+
+    _RENDER_PAGES = pages
+    pool = context.Pool(app.jobs, _init_worker, initargs)
+    try:
+        for ((dest, digest), events, found) in pool.map(_render_page, indices, chunksize):
+            app.writer.record(dest, digest)
+            app.profiler.collect(events)
+            if app.links is not None:
+                app.links.collect(found)
+    finally:
+        pool.close()
+        pool.join()
+        _RENDER_PAGES = None
+
+def _init_worker(args):
+    """
+    Set up a worker process, rebuilding the page tree if it wasn't
+    inherited from the parent.  Profiling events recorded before the
+    worker started rendering (the parent's, if it was forked, or those
+    of loading the pages again) are discarded, since the parent has
+    its own record of loading the pages.
+    """
+    global _RENDER_PAGES
+    if args is not None:
+        args, archive_names = args
+        app = Application(args)
+        app.writer = OutputWriter(app)
+        if app.check_links:
+            app.links = LinkChecker(app)
+        factory = PageFactory(app)
+        _RENDER_PAGES = load_pages(app, factory)
+        archive_classes = [c for name in archive_names
+                           for c in ARCHIVE_CLASSES if c.__name__ == name]
+        _RENDER_PAGES.extend(create_archives(app, factory, archive_classes))
+    if _RENDER_PAGES:
+        _RENDER_PAGES[0].app.profiler.take()
+
+def _render_page(index):
+    """
+    Render a single page in a worker process, returning the output
+    path and hash for the parent's OutputWriter along with any
+    profiling events and the links found in the page.
+    """
+    page = _RENDER_PAGES[index]
+    result = page._render()
+    links = page.app.links
+    return (result, page.app.profiler.take(), links.take() if links else {})
+
+#----------------------------------------
+
+def replace(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists.  (os.rename does
+    this atomically on POSIX, but only Python 3's os.replace does it
+    on Windows.)
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
 
 #----------------------------------------
 
@@ -918,7 +2609,32 @@ def timestamp():
     """
     Return the current UTC time formatted in ISO 8601
     """
-    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime())
+
+def glob_directories(pattern):
+    """
+    Return the directories a file glob looks in: those matching each
+    leading part of the pattern.  (Their modification times change
+    whenever matching files are added or removed.)
+    """
+    directory = os.path.dirname(pattern)
+    if not directory:
+        return [os.curdir]
+    parts = directory.split('/')
+    result = []
+    for i in range(len(parts)):
+        result.extend(d for d in sorted(glob.glob('/'.join(parts[:i+1])))
+                      if os.path.isdir(d))
+    return result
+
+def content_type(path):
+    """
+    Guess the content type to serve a file as from its name.
+    """
+    result = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if result.startswith('text/') or path.endswith(COMPRESSIBLE):
+        result += '; charset=utf-8'
+    return result
 
 #----------------------------------------
 
@@ -931,24 +2647,152 @@ def usage(exit_status):
 
 #----------------------------------------
 
-def main(args):
+def build(app, factory):
     """
-    Main driver:
-    * construct an application manager
-    * construct a page factory
-    * create and render page objects for each page (recursively)
+    Build the site:
+    * put static files in the output directory if asked to do so
+    * create page objects for each page (recursively), and for the
+      pages of the category, author, and instructor archives
+    * render them (in parallel if asked to), skipping pages whose
+      inputs haven't changed since the last build
+    * generate the client-side search index if asked to do so (in
+      full builds only)
     * generate the blog's feed.xml file if asked to do so
+    * generate the boot camp iCalendar file if asked to do so
+    * report broken links in rendered pages if asked to do so
+    Output files are only rewritten if their contents have changed.
+    Returns the number of pages rendered.
+    """
+    if app.assets is not None:
+        with app.profiler.phase('assets'):
+            app.assets.publish()
+    pages = load_pages(app, factory)
+    if app.only:
+        stale = select_partial(app, pages)
+    else:
+        stale = [page for page in pages if app.depgraph.is_stale(page)]
+
+    # In partial builds, archives and feeds are only regenerated if
+    # some of their pages were asked for, since only then were all of
+    # them loaded.  Archive pages are rendered along with the rest (in
+    # the same worker processes).
+    want_blog = want_bootcamps = True
+    if app.only:
+        want_blog = any(isinstance(p, BlogPostPage) for p in stale)
+        want_bootcamps = any(isinstance(p, BootCampPage) for p in stale)
+    wanted = [c for c in ARCHIVE_CLASSES
+              if (want_blog and c.PAGE_CLASS is BlogPostPage) or
+                 (want_bootcamps and c.PAGE_CLASS is BootCampPage)]
+    with app.profiler.phase('archives'):
+        archives = create_archives(app, factory, wanted)
+        stale.extend(page for page in archives if app.depgraph.is_stale(page))
+    render_pages(app, pages + archives, stale, wanted)
+    for page in stale:
+        app.depgraph.record(page)
+    count = len(stale)
+    if app.search_dir and not app.only:
+        with app.profiler.phase('search'):
+            create_search_index(app, pages)
+    app.depgraph.save()
+    app.metaindex.save(prune=not app.only)
+
+    if app.blog_filename and want_blog:
+        with app.profiler.phase('rss'):
+            create_rss(app.writer, app.blog_filename, app.site,
+                       factory.created(BlogPostPage), app.build_datetime())
+    if app.icalendar_filename and want_bootcamps:
+        with app.profiler.phase('icalendar'):
+            icw = ICalendarWriter(app.writer, app.timestamp())
+            icw(app.icalendar_filename, app.site, factory.created(BootCampPage))
+    app.writer.save()
+
+    if app.links is not None:
+        with app.profiler.phase('links'):
+            for (page, normalized, raw) in app.links.check():
+                print('{0}: {1} ({2})'.format(page, raw, normalized))
+            app.links.save()
+    return count
+
+def watch(app, factory):
+    """
+    Rebuild the site whenever files in the search path (or the
+    metadata file) change, until interrupted.  The application (with
+    its Jinja2 environment, source store, and metadata index), the
+    page factory, the dependency graph, and the output writer all stay
+    in memory, so only files that have changed are read again.  Pages
+    whose files haven't changed are reused, but pages that index others
+    are made again (from cached metadata), so that new and deleted
+    pages are picked up exactly as they are in a full build; only the
+    pages whose inputs have changed are rendered.  Errors are reported,
+    and the next change is waited for.
+    """
+    directories = list(app.search_path)
+    if app.metadata_filename is not None:
+        directories.append(os.path.dirname(app.metadata_filename) or os.curdir)
+    ignore = [app.output_dir, app.cache_dir, app.search_dir, app.blog_filename,
+              app.icalendar_filename, app.profile_filename]
+    watcher = Watcher(directories, ignore)
+    sys.stderr.write('watching %s for changes (using %s)\n' %
+                     (', '.join(watcher.roots), watcher.method))
+    try:
+        while True:
+            changed = watcher.wait()
+            begin = time.time()
+            try:
+                app.refresh(changed)
+                factory.reset(changed)
+                count = build(app, factory)
+            except Exception:
+                traceback.print_exc()
+                continue
+            sys.stderr.write('%d file(s) changed, %d page(s) rendered in %d ms\n' %
+                             (len(changed), count, int((time.time() - begin) * 1e3)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+def serve(app):
+    """
+    Serve the site from memory until interrupted, rendering each page
+    when it is first asked for and again whenever its inputs change
+    (see PageServer).  Nothing is rendered or written beforehand, so
+    the server starts at once.  Requests are handled one at a time,
+    since they share the application's state.  The metadata index is
+    saved on the way out, so that what was learned about pages speeds
+    up the next build.
+    """
+    server = HTTPServer(('localhost', app.serve_port), PageRequestHandler)
+    server.pages = PageServer(app)
+    sys.stderr.write('serving %s at http://localhost:%d/\n' %
+                     (', '.join(app.filenames), app.serve_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        app.metaindex.save(prune=False)
+
+def main(args):
+    """
+    Main driver: construct an application manager and a page factory,
+    build the site, and then (if asked to) keep rebuilding it as files
+    change.  The development server builds nothing up front.
     """
     app = Application(args)
+    if app.serve_port is not None:
+        serve(app)
+        return
     factory = PageFactory(app)
-    for filename in app.filenames:
-        page = factory(filename, filename, None)
-        page.render()
-    if app.blog_filename:
-        create_rss(app.blog_filename, app.site, BlogPostPage.Instances)
-    if app.icalendar_filename:
-        icw = ICalendarWriter()
-        icw(app.icalendar_filename, app.site, BootCampPage.Instances)
+    app.depgraph = DependencyGraph(app, factory)
+    app.writer = OutputWriter(app)
+    if app.check_links:
+        app.links = LinkChecker(app)
+    build(app, factory)
+    if app.watch:
+        watch(app, factory)
+    app.profiler.save()
 
 #----------------------------------------
 
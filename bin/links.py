@@ -2,11 +2,65 @@
 
 """
 Quick and dirty link checker.  Please use a real one for production checks.
+
+Files are parsed in parallel (-j), with html5lib by default or with
+lxml's much faster native HTML parser (-f).  If a build cache directory
+is given (-b), the links found in each file are remembered by the
+SHA-1 hash of its contents, so later runs only parse files that have
+changed.  Links to other web sites are only checked if asked for (-e),
+by urlcheck.py.
+
+The same parse records the anchors in each file (the ids of its
+elements and the names of its <a> elements), so links to fragments of
+pages ('page.html#section', or just '#section') are checked against
+them as well.
 """
 
 import sys
 import os
-from util import read_xml
+import getopt
+import hashlib
+import json
+import multiprocessing
+import re
+try:  # Python 3
+    from html import unescape
+    from urllib.parse import unquote
+except ImportError:  # Python 2
+    from HTMLParser import HTMLParser
+    from urllib import unquote
+    unescape = HTMLParser().unescape
+
+#-------------------------------------------------------------------------------
+
+USAGE = """links.py [options] root_dir: check links in files named on standard input
+-b build_cache_directory_path           optional (only parse changed files)
+-e                                      also check links to other web sites
+                                        (needs Python 3.7)
+-f                                      parse with lxml's HTML parser (fast)
+                                        instead of html5lib
+-h                                      show this help and exit
+-j number_of_jobs                       optional (parse files in parallel)
+"""
+
+CACHE_FILE = 'links.json'
+VERSION = 2
+
+# For finding links and anchors in text without parsing it (see
+# find_hrefs and find_ids): the parts of a page that can't contain
+# them, the href of an <a> tag, the id of any tag, and the name of an
+# <a> tag (each quoted either way or not at all).
+SKIP_PAT = re.compile(r'<!--.*?-->|<(script|style)\b.*?</\1\s*>',
+                      re.IGNORECASE | re.DOTALL)
+ATTR_PAT = r'''(?:[^>"']|"[^"]*"|'[^']*')*?(?<=\s)%s\s*=\s*''' \
+           r'''(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))'''
+HREF_PAT = re.compile(r'<a\s' + ATTR_PAT % 'href', re.IGNORECASE)
+ID_PAT = re.compile(r'<[a-z][^\s/>]*\s' + ATTR_PAT % 'id', re.IGNORECASE)
+NAME_PAT = re.compile(r'<a\s' + ATTR_PAT % 'name', re.IGNORECASE)
+
+# Fragments that don't need an anchor: an empty one, and 'top', which
+# browsers take to mean the top of the page.
+IMPLICIT_ANCHORS = ('', 'top')
 
 #-------------------------------------------------------------------------------
 
@@ -45,44 +99,249 @@ def normalize(root_dir, filename, raw):
 
 #-------------------------------------------------------------------------------
 
-def get_links(root_dir, filenames):
+def extract(task):
+    """
+    Return the hrefs of the links in one file and the anchors in it
+    (as a dictionary with keys 'hrefs' and 'ids').  Runs in worker
+    processes.
+    """
+    filename, fast = task
+    # (Imported here so that only the parser being used has to be
+    # installed.)
+    if fast:
+        from lxml import html
+        doc = html.parse(filename)
+    else:
+        from util import read_xml
+        doc = read_xml(filename)
+    # html5lib puts elements in the XHTML namespace; lxml doesn't.
+    hrefs = [a.get('href') for a in doc.iter('{*}a') if a.get('href') is not None]
+    ids = doc.xpath('//@id', smart_strings=False) + \
+          doc.xpath('//*[local-name()="a"]/@name', smart_strings=False)
+    return {'hrefs' : hrefs, 'ids' : ids}
+
+def find_hrefs(text):
+    """
+    Return the hrefs of the links in a page's text, found with regular
+    expressions rather than by parsing it (so that compile.py can
+    check the pages it renders while they are in memory).  Comments,
+    scripts, and style sheets are skipped, as a parser would.
+    """
+    text = SKIP_PAT.sub('', text)
+    return [unescape(''.join(m.groups(''))) for m in HREF_PAT.finditer(text)]
+
+def find_ids(text):
+    """
+    Return the anchors in a page's text (see find_hrefs): the ids of
+    its elements and the names of its <a> elements.
+    """
+    text = SKIP_PAT.sub('', text)
+    return [unescape(''.join(m.groups(''))) for pat in (ID_PAT, NAME_PAT)
+            for m in pat.finditer(text)]
+
+def parse_files(filenames, jobs=1, fast=False, cache=None):
+    """
+    Return a dictionary mapping each file to the hrefs and anchors in it
+    (see extract).  'cache' maps the hashes of files' contents to what
+    was found in them; files whose hashes are in it aren't parsed, what
+    is found in those that are parsed is added to it, and contents that
+    weren't seen are dropped.
+    """
+    if cache is None:
+        cache = {}
+    digests = dict((f, hash_file(f)) for f in filenames)
+    todo = {}
+    for f in sorted(filenames):
+        if digests[f] not in cache:
+            todo.setdefault(digests[f], f)
+    tasks = [(f, fast) for f in todo.values()]
+
+    if (jobs == 1) or (len(tasks) < 2):
+        results = [extract(t) for t in tasks]
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(extract, tasks, max(1, len(tasks) // (4 * jobs)))
+        finally:
+            pool.close()
+            pool.join()
+    for (digest, found) in zip(todo.keys(), results):
+        cache[digest] = found
+    for digest in set(cache) - set(digests.values()):
+        del cache[digest]
+    return dict((f, cache[digests[f]]) for f in filenames)
+
+def get_links(root_dir, filenames, jobs=1, fast=False, cache=None):
     """
     Extract links from files, return a set of (filename, normalized, raw) links.
+    (See parse_files for the other arguments.)
+    """
+    return local_links(root_dir, parse_files(filenames, jobs, fast, cache))
+
+def local_links(root_dir, found):
+    """
+    Return the set of (filename, normalized, raw) local links, given
+    what was found in each file.
     """
     links = set()
-    for f in filenames:
-        doc = read_xml(f)
-        try:
-            tags = doc.findall('.//a[@href]')
-        except SyntaxError:  # ElementTree 1.2 lacks attribute XPath support
-            tags = [t for t in doc.findall('.//a') if 'href' in t.attrib]
-        links.update(set(normalize(root_dir, f, r.attrib['href'])
-                         for r in tags))
+    for (f, entry) in found.items():
+        links.update(set(normalize(root_dir, f, r) for r in entry['hrefs']))
     return set(lnk for lnk in links if lnk)  # filter out None's
 
+def external_links(found):
+    """
+    Return the set of (filename, raw) links to other web sites, given
+    what was found in each file.
+    """
+    return set((f, r) for (f, entry) in found.items() for r in entry['hrefs']
+               if r.startswith(('http:', 'https:')))
+
+def missing_anchors(root_dir, found):
+    """
+    Return the sorted (filename, target, raw) links to fragments of
+    pages that have no such anchor, given what was found in each file.
+    Only links to pages in 'found' are checked: links to pages that
+    don't exist are reported as missing links instead.
+    """
+    anchors = dict((f, set(entry['ids'])) for (f, entry) in found.items())
+    result = set()
+    for (f, entry) in found.items():
+        for raw in entry['hrefs']:
+            if '#' not in raw:
+                continue
+            fragment = unquote(raw.split('#', 1)[1])
+            if fragment.lower() in IMPLICIT_ANCHORS:
+                continue
+            if raw.startswith('#'):
+                page = f
+            else:
+                link = normalize(root_dir, f, raw)
+                if link is None:
+                    continue
+                page = link[1]
+            if (page in anchors) and (fragment not in anchors[page]):
+                result.add((f, page + '#' + fragment, raw))
+    return sorted(result)
+
+def hash_file(filename):
+    """
+    Return the SHA-1 hash of a file's contents.
+    """
+    with open(filename, 'rb') as reader:
+        return hashlib.sha1(reader.read()).hexdigest()
+
+#-------------------------------------------------------------------------------
+
+def load_cache(filename, fast):
+    """
+    Load the hrefs found last time (if any, and if the same parser was used).
+    """
+    if (filename is None) or (not os.path.isfile(filename)):
+        return {}
+    with open(filename, 'r') as reader:
+        data = json.load(reader)
+    if (data.get('version') != VERSION) or (data.get('fast') != fast):
+        return {}
+    return data['files']
+
+def save_cache(filename, fast, cache):
+    """
+    Save the hrefs of the files checked this time.
+    """
+    if filename is None:
+        return
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as writer:
+        writer.write(json.dumps({'version' : VERSION, 'fast' : fast,
+                                 'files' : cache}, sort_keys=True))
+
 #-------------------------------------------------------------------------------
 
 def show_missing(all_files, links):
     """
     Which links are missing?
     """
-    for (source, normalized, raw) in links:
+    for (source, normalized, raw) in sorted(links):
         if normalized not in all_files:
             print('{0}: {1} ({2})'.format(source, raw, normalized))
 
+def show_missing_anchors(root_dir, found):
+    """
+    Which links lead to anchors that aren't there?
+    """
+    for (source, target, raw) in missing_anchors(root_dir, found):
+        print('{0}: {1} ({2})'.format(source, raw, target))
+
+def show_broken(cache_dir, links):
+    """
+    Which links to other web sites don't work?  (Results are kept in
+    the build cache directory, if there is one; see urlcheck.py.)
+    """
+    # (Imported here because urlcheck needs Python 3.)
+    import urlcheck
+    filename = None
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, urlcheck.CACHE_FILE)
+    checker = urlcheck.URLChecker(filename)
+    results = checker.check(raw.split('#')[0] for (source, raw) in links)
+    checker.save()
+    for (source, raw) in sorted(links):
+        result = results[raw.split('#')[0]]
+        if not urlcheck.is_ok(result):
+            print('{0}: {1} ({2})'.format(source, raw, urlcheck.describe(result)))
+
 #-------------------------------------------------------------------------------
 
-def main(root_dir):
+def usage(exit_status):
+    """
+    Show usage and exit.
+    """
+    sys.stderr.write(USAGE)
+    sys.exit(exit_status)
+
+def main(args):
     """
     Main command-line driver.
     """
+    cache_dir, external, fast, jobs = None, False, False, 1
+    options, args = getopt.getopt(args, 'b:efhj:')
+    for opt, arg in options:
+        if opt == '-b':
+            cache_dir = arg
+        elif opt == '-e':
+            external = True
+        elif opt == '-f':
+            fast = True
+        elif opt == '-h':
+            usage(0)
+        elif opt == '-j':
+            assert arg.isdigit() and int(arg) > 0, \
+                   'Number of jobs must be a positive integer'
+            jobs = int(arg)
+        else:
+            assert False, \
+                   'Unknown option %s' % opt
+    if len(args) != 1:
+        usage(1)
+    root_dir = args[0]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, CACHE_FILE)
+    cache = load_cache(cache_file, fast)
+
     filenames = set(os.path.abspath(f.strip()) for f in sys.stdin)
-    links = get_links(root_dir, [f for f in filenames if f.endswith('.html')])
-    show_missing(filenames, links)
+    pages = [f for f in filenames if f.endswith('.html')]
+    found = parse_files(pages, jobs, fast, cache)
+    save_cache(cache_file, fast, cache)
+    show_missing(filenames, local_links(root_dir, found))
+    show_missing_anchors(root_dir, found)
+    if external:
+        show_broken(cache_dir, external_links(found))
 
 #-------------------------------------------------------------------------------
 
 if __name__ == '__main__':
-    assert len(sys.argv) == 2, \
-           'Usage: links.py root_dir (filenames in stdin)'
-    main(sys.argv[1])
+    main(sys.argv[1:])
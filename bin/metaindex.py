@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+"""
+Persistent index of the metadata embedded in page sources.
+
+compile.py needs the <meta...> fields of every blog post and boot camp
+to build index pages and feeds, and the page class of every page to
+construct it.  Rather than re-reading and re-parsing every file on
+every build, it keeps what it found in a SQLite database, keyed by
+file name and checked against each file's modification time and size.
+If only the modification time has changed (e.g., the file was checked
+out again), the SHA-1 hash of its contents is compared as well, so
+only files whose contents have changed since they were last indexed
+are parsed.
+
+compile.py still creates a page object for every post and boot camp,
+since each of them is rendered (or checked for being up to date), and
+index pages, feeds, and archives are built from those objects; the
+index saves reading and parsing the files, not creating the objects.
+Only 'make blog-next-id' queries the database directly (see below).
+
+The database has two tables: 'files' (one row per source file, with
+its stat information, a SHA-1 hash of its contents, its page class
+declaration, and its metadata as JSON), and 'fields' (one row per
+metadata value) so that values can be queried directly.
+
+Run as a script, this refreshes the index for the files matching some
+glob patterns and prints one more than the largest integer value of a
+field, e.g.:
+
+    python bin/metaindex.py .cache/metadata.sqlite post_id 'blog/*/*/*.html'
+
+prints the ID to use for the next blog post.
+"""
+
+import sys
+import os
+import io
+import re
+import glob
+import json
+import hashlib
+import sqlite3
+
+#-------------------------------------------------------------------------------
+
+METADATA_PAT = re.compile(r'<meta\s+name="([^"]+)"\s+content="([^"]*)"\s*/>')
+METADATA_END = '{% endblock file_metadata %}'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    filename   TEXT PRIMARY KEY,
+    mtime      REAL NOT NULL,
+    size       INTEGER NOT NULL,
+    digest     TEXT,
+    classified INTEGER NOT NULL DEFAULT 0,
+    pageclass  TEXT,
+    base       TEXT,
+    metadata   TEXT
+);
+CREATE TABLE IF NOT EXISTS fields (
+    filename   TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    value      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_by_file ON fields (filename);
+CREATE INDEX IF NOT EXISTS fields_by_name ON fields (name, value);
+'''
+
+#-------------------------------------------------------------------------------
+
+def extract_metadata(text):
+    """
+    Return the (name, value) pairs of all the <meta...> tags in the
+    file_metadata block of a page (or in the whole page if it has no
+    such block), in the order they appear.
+    """
+    end = text.find(METADATA_END)
+    block = text if (end < 0) else text[:end]
+    return METADATA_PAT.findall(block)
+
+def hash_file(filename):
+    """
+    Return the SHA-1 hash of a file's contents.
+    """
+    with open(filename, 'rb') as reader:
+        return hashlib.sha1(reader.read()).hexdigest()
+
+#-------------------------------------------------------------------------------
+
+class MetadataIndex(object):
+    """
+    The whole index is loaded when it's opened and changes are written
+    back in one transaction by save(), so that nothing touches the
+    database while pages are being constructed (or in forked worker
+    processes).  If no filename is given, nothing is remembered
+    between runs.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = {}
+        self.pending = {}
+        self.stats = {}
+        self.seen = set()
+        if (filename is not None) and os.path.isfile(filename):
+            self._load()
+
+    def lookup(self, path):
+        """
+        Return the indexed information for a file as a dictionary, or
+        None if the file isn't indexed or has changed since it was.  A
+        file whose modification time has changed but whose contents
+        haven't is still indexed (with its new time).
+        """
+        key = os.path.normpath(path)
+        self.seen.add(key)
+        row = self.pending.get(key) or self.rows.get(key)
+        if row is None:
+            return None
+        mtime, size = self._stat(key)
+        if row['size'] != size:
+            return None
+        if row['mtime'] != mtime:
+            if (row['digest'] is None) or (row['digest'] != hash_file(key)):
+                return None
+            row = dict(row, mtime=mtime)
+            self.pending[key] = row
+        return row
+
+    def classify(self, path, pageclass, base):
+        """
+        Record a file's page class declaration (or None) and the
+        template it extends (or None).
+        """
+        row = self._pending(path)
+        row['classified'] = True
+        row['pageclass'] = pageclass
+        row['base'] = base
+
+    def set_metadata(self, path, text, fields):
+        """
+        Record the metadata (name, value) pairs extracted from a file,
+        along with a hash of its text.
+        """
+        row = self._pending(path)
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        row['digest'] = hashlib.sha1(text).hexdigest()
+        row['metadata'] = [list(f) for f in fields]
+
+    def refresh(self, paths=None):
+        """
+        Forget the modification times and sizes of files that have
+        changed (e.g., while watching for changes), or of all files if
+        no paths are given, so that they are checked again.
+        """
+        if paths is None:
+            self.stats = {}
+            return
+        for path in paths:
+            self.stats.pop(os.path.normpath(path), None)
+
+    def max_value(self, name):
+        """
+        Return the largest integer value of a field in the saved index,
+        or 0 if there are none.
+        """
+        connection = sqlite3.connect(self.filename)
+        try:
+            query = 'SELECT MAX(CAST(value AS INTEGER)) FROM fields WHERE name = ?'
+            (best,) = connection.execute(query, (name,)).fetchone()
+        finally:
+            connection.close()
+        return best or 0
+
+    def save(self, prune=False):
+        """
+        Write changes to the database.  If 'prune' is true, also forget
+        files that weren't looked up in this run (i.e., files that no
+        longer exist or are no longer part of the site).
+        """
+        if self.filename is None:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        connection = sqlite3.connect(self.filename)
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+                for (key, row) in sorted(self.pending.items()):
+                    self._write(connection, key, row)
+                if prune:
+                    for key in sorted(set(self.rows) - self.seen):
+                        connection.execute('DELETE FROM files WHERE filename = ?', (key,))
+                        connection.execute('DELETE FROM fields WHERE filename = ?', (key,))
+        finally:
+            connection.close()
+
+        self.rows.update(self.pending)
+        self.pending = {}
+
+    def _pending(self, path):
+        """
+        Get the row being updated for a file, starting from what's
+        indexed if the file hasn't changed.
+        """
+        key = os.path.normpath(path)
+        if key not in self.pending:
+            mtime, size = self._stat(key)
+            old = self.lookup(key)
+            if old is None:
+                row = {'mtime' : mtime, 'size' : size, 'digest' : None,
+                       'classified' : False, 'pageclass' : None,
+                       'base' : None, 'metadata' : None}
+            else:
+                row = dict(old)
+            self.pending[key] = row
+        return self.pending[key]
+
+    def _stat(self, key):
+        """
+        Return (modification time, size) of a file, checking each file
+        only once per run (unless it is refreshed).
+        """
+        if key not in self.stats:
+            st = os.stat(key)
+            self.stats[key] = (st.st_mtime, st.st_size)
+        return self.stats[key]
+
+    def _load(self):
+        """
+        Load everything from the database.
+        """
+        connection = sqlite3.connect(self.filename)
+        try:
+            connection.executescript(SCHEMA)
+            query = 'SELECT filename, mtime, size, digest, classified, ' \
+                    'pageclass, base, metadata FROM files'
+            for (key, mtime, size, digest, classified, pageclass, base, metadata) \
+                in connection.execute(query):
+                self.rows[key] = {'mtime' : mtime,
+                                  'size' : size,
+                                  'digest' : digest,
+                                  'classified' : bool(classified),
+                                  'pageclass' : pageclass,
+                                  'base' : base,
+                                  'metadata' : None if (metadata is None)
+                                               else json.loads(metadata)}
+        finally:
+            connection.close()
+
+    def _write(self, connection, key, row):
+        """
+        Save one file's row (and its metadata fields).
+        """
+        metadata = None if (row['metadata'] is None) else json.dumps(row['metadata'])
+        connection.execute('INSERT OR REPLACE INTO files '
+                           '(filename, mtime, size, digest, classified, pageclass, base, metadata) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (key, row['mtime'], row['size'], row['digest'],
+                            int(row['classified']), row['pageclass'], row['base'],
+                            metadata))
+        connection.execute('DELETE FROM fields WHERE filename = ?', (key,))
+        connection.executemany('INSERT INTO fields (filename, name, value) VALUES (?, ?, ?)',
+                               [(key, name, value) for (name, value) in (row['metadata'] or [])])
+
+#-------------------------------------------------------------------------------
+
+def main(args):
+    """
+    Refresh the index for some files and report the next value of a
+    field.
+    """
+    assert len(args) >= 3, \
+           'Usage: metaindex.py index_file field_name glob_pattern...'
+    index = MetadataIndex(args[0])
+    field = args[1]
+    for pattern in args[2:]:
+        for path in glob.glob(pattern):
+            row = index.lookup(path)
+            if (row is None) or (row['metadata'] is None):
+                with io.open(path, 'r', encoding='utf-8') as reader:
+                    text = reader.read()
+                index.set_metadata(path, text, extract_metadata(text))
+    index.save()
+    print(1 + index.max_value(field))
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Shrink generated HTML as it is produced.
+
+Minifier works on a stream of text chunks (such as the output of a
+Jinja2 template's generate() method) and yields minified chunks,
+holding no more than the construct it is in the middle of (a tag, or
+the end of a comment or raw element) at any time.  It:
+
+* removes comments (except Internet Explorer conditional comments,
+  which the site uses to load scripts);
+* collapses each run of whitespace in text to a single newline (if
+  the run contained one) or space; and
+* leaves tags, and the contents of <pre>, <textarea>, <script>, and
+  <style> elements, exactly as they are.
+
+Run as a script, it minifies standard input to standard output.
+"""
+
+import sys
+import re
+
+#-------------------------------------------------------------------------------
+
+RAW_START_PAT = re.compile(r'<(pre|textarea|script|style)(?=[\s>/])', re.IGNORECASE)
+TAG_PAT = re.compile(r'''<(?:[^>"']|"[^"]*"|'[^']*')*>''')
+WHITESPACE_PAT = re.compile(r'\s+')
+LEADING_PAT = re.compile(r'^\s+')
+TRAILING_PAT = re.compile(r'\s+$')
+
+COMMENT_START = '<!--'
+COMMENT_END = '-->'
+CONDITIONAL_START = '<!--['
+
+# Enough characters to recognize anything that can follow '<' (the
+# longest being '<textarea' plus the character after it).
+LOOKAHEAD = len('<textarea') + 1
+
+TEXT, TAG, COMMENT, RAW = 'text', 'tag', 'comment', 'raw'
+
+#-------------------------------------------------------------------------------
+
+class Minifier(object):
+    """
+    Call with an iterable of text chunks to get an iterator over
+    minified chunks.  Each instance should only be used for one
+    document.
+    """
+
+    def __init__(self):
+        self.buf = ''
+        self.state = TEXT
+        self.raw_end = None
+        self.keep_comment = False
+        self.space = ''
+
+    def __call__(self, chunks):
+        for chunk in chunks:
+            result = self.feed(chunk)
+            if result:
+                yield result
+        result = self.close()
+        if result:
+            yield result
+
+    def feed(self, chunk):
+        """
+        Add a chunk of input, returning whatever output is ready.
+        """
+        # Join rather than add, so that the buffer is always a plain
+        # string even if chunks are Jinja2 Markup objects (adding to
+        # which would escape the other operand).
+        self.buf = ''.join([self.buf, chunk])
+        return self._process(False)
+
+    def close(self):
+        """
+        Finish the document, returning the remaining output.
+        """
+        result = self._process(True)
+        if self.space:
+            result += self._space()
+        return result
+
+    def _process(self, final):
+        """
+        Consume as much of the buffer as can be handled without seeing
+        more input (or all of it, if this is the end of the input).
+        """
+        out = []
+        while self.buf:
+
+            if self.state == TEXT:
+                i = self.buf.find('<')
+                if i < 0:
+                    self._text(self.buf, out)
+                    self.buf = ''
+                    break
+                self._text(self.buf[:i], out)
+                self.buf = self.buf[i:]
+                if (len(self.buf) < LOOKAHEAD) and not final:
+                    break
+                if self.buf.startswith(COMMENT_START):
+                    self.keep_comment = self.buf.startswith(CONDITIONAL_START)
+                    self.state = COMMENT
+                else:
+                    m = RAW_START_PAT.match(self.buf)
+                    if m:
+                        self.raw_end = '</' + m.group(1).lower()
+                    self.state = TAG
+
+            elif self.state == TAG:
+                m = TAG_PAT.match(self.buf)
+                if m is None:
+                    if final:
+                        out.append(self._space() + self.buf)
+                        self.buf = ''
+                    break
+                out.append(self._space() + m.group(0))
+                self.buf = self.buf[m.end():]
+                self.state = RAW if self.raw_end else TEXT
+
+            elif self.state == COMMENT:
+                i = self.buf.find(COMMENT_END)
+                if i < 0:
+                    keep = 0 if final else len(COMMENT_END) - 1
+                    cut = max(0, len(self.buf) - keep)
+                    if self.keep_comment:
+                        out.append(self._space() + self.buf[:cut])
+                    self.buf = self.buf[cut:]
+                    break
+                end = i + len(COMMENT_END)
+                if self.keep_comment:
+                    out.append(self._space() + self.buf[:end])
+                self.buf = self.buf[end:]
+                self.state = TEXT
+
+            elif self.state == RAW:
+                i = self.buf.lower().find(self.raw_end)
+                if i < 0:
+                    keep = 0 if final else len(self.raw_end) - 1
+                    cut = max(0, len(self.buf) - keep)
+                    out.append(self.buf[:cut])
+                    self.buf = self.buf[cut:]
+                    break
+                out.append(self.buf[:i])
+                self.buf = self.buf[i:]
+                self.raw_end = None
+                self.state = TAG
+
+        return ''.join(out)
+
+    def _text(self, text, out):
+        """
+        Collapse whitespace in text.  Whitespace at the end is held
+        back, since the next chunk may continue it (or a comment may be
+        dropped between it and more whitespace).
+        """
+        m = LEADING_PAT.match(text)
+        if m:
+            self.space += m.group(0)
+            text = text[m.end():]
+        if not text:
+            return
+        m = TRAILING_PAT.search(text)
+        trailing = ''
+        if m:
+            trailing = m.group(0)
+            text = text[:m.start()]
+        out.append(self._space() + WHITESPACE_PAT.sub(collapse, text))
+        self.space = trailing
+
+    def _space(self):
+        """
+        Return (and forget) the whitespace held back, collapsed.
+        """
+        if not self.space:
+            return ''
+        result = '\n' if ('\n' in self.space) else ' '
+        self.space = ''
+        return result
+
+#-------------------------------------------------------------------------------
+
+def collapse(match):
+    """
+    Replace a run of whitespace with a newline or a space.
+    """
+    return '\n' if ('\n' in match.group(0)) else ' '
+
+def minify(text):
+    """
+    Minify a whole document at once.
+    """
+    return ''.join(Minifier()([text]))
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    sys.stdout.write(minify(sys.stdin.read()))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+Write precompressed copies of the site's text files.
+
+For every HTML, CSS, JavaScript, XML, iCalendar, and JSON file under
+the output directory, this writes 'file.gz' (and 'file.br', if the
+'brotli' module is installed) beside it, so that the web server can
+send the compressed version to clients that accept it (see the rules
+in _htaccess) instead of compressing every response on the fly.
+
+Files are compressed in parallel.  The SHA-1 hash of each file is
+remembered (by absolute path, since one build cache directory may be
+shared by several output directories) in the build cache directory,
+and files whose contents haven't changed since the last run are
+skipped.  Compressed copies of files that no longer exist (or that
+don't get smaller when compressed) are removed.  If compile.py has
+written a manifest of the output directory, the compressed copies are
+added to it (for bin/publish.py).
+"""
+
+import sys
+import os
+import io
+import getopt
+import gzip
+import hashlib
+import json
+import multiprocessing
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#-------------------------------------------------------------------------------
+
+USAGE = """precompress.py [options] output_directory_path: precompress site files
+-b build_cache_directory_path           optional (skip unchanged files)
+-h                                      show this help and exit
+-j number_of_jobs                       optional (compress in parallel)
+"""
+
+EXTENSIONS = ('.html', '.css', '.js', '.xml', '.ics', '.json')
+SUFFIXES = ('.gz', '.br')
+MIN_SIZE = 256
+CACHE_FILE = 'precompress.json'
+OUTPUT_MANIFEST = '.manifest.json'
+VERSION = 4
+
+#-------------------------------------------------------------------------------
+
+def encoders():
+    """
+    Return (suffix, compression function) pairs for the encodings
+    available here.
+    """
+    result = [('.gz', gzip_bytes)]
+    if brotli is not None:
+        result.append(('.br', brotli_bytes))
+    return result
+
+def gzip_bytes(data):
+    """
+    Compress with gzip, leaving the name and time out of the header so
+    that the same input always gives the same output.
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf,
+                       compresslevel=9, mtime=0) as writer:
+        writer.write(data)
+    return buf.getvalue()
+
+def brotli_bytes(data):
+    """
+    Compress with Brotli at its highest quality, tuned for text.
+    """
+    return brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+
+#-------------------------------------------------------------------------------
+
+def find_files(root_dir):
+    """
+    Return the sorted paths (relative to root_dir) of all files that
+    should be precompressed, and of all compressed siblings found.
+    """
+    sources, compressed = [], []
+    for (dirpath, dirnames, filenames) in os.walk(root_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.startswith('.'):
+                continue
+            path = os.path.relpath(os.path.join(dirpath, name), root_dir)
+            if name.endswith(EXTENSIONS):
+                sources.append(path)
+            elif is_compressed(name):
+                compressed.append(path)
+    return sources, compressed
+
+def is_compressed(name):
+    """
+    Is this the name of a compressed copy written by this program?
+    """
+    return name.endswith(SUFFIXES) and \
+           os.path.splitext(name)[0].endswith(EXTENSIONS)
+
+def compress(task):
+    """
+    Compress one file if its contents have changed (or any of the
+    compressed siblings kept last time is missing, or the encodings
+    available have changed), returning its path, a record of its hash,
+    the encodings tried, and the hashes of the compressed copies kept,
+    and whether anything was written.  Runs in worker processes.
+    """
+    root_dir, path, old = task
+    full = os.path.join(root_dir, path)
+    with open(full, 'rb') as reader:
+        data = reader.read()
+    digest = hashlib.sha1(data).hexdigest()
+
+    wanted = dict(encoders()) if (len(data) >= MIN_SIZE) else {}
+    if (old is not None) and (old['digest'] == digest) and \
+       (old['tried'] == sorted(wanted)) and \
+       all(os.path.isfile(full + suffix) for suffix in old['compressed']):
+        return (path, old, False)
+
+    record = {'digest' : digest, 'tried' : sorted(wanted), 'compressed' : {}}
+    for suffix in SUFFIXES:
+        packed = wanted[suffix](data) if (suffix in wanted) else None
+        if (packed is not None) and (len(packed) < len(data)):
+            write_atomic(full + suffix, packed)
+            record['compressed'][suffix] = hashlib.sha1(packed).hexdigest()
+        elif os.path.isfile(full + suffix):
+            os.unlink(full + suffix)
+    return (path, record, True)
+
+def write_atomic(path, data):
+    """
+    Write bytes to a temporary file beside 'path', then rename it, so
+    that the server never sees a partly-written file.
+    """
+    directory = os.path.dirname(path)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as writer:
+            writer.write(data)
+        os.chmod(temp, 0o644)
+        if hasattr(os, 'replace'):
+            os.replace(temp, path)
+        else:
+            os.rename(temp, path)
+    except:
+        os.unlink(temp)
+        raise
+
+#-------------------------------------------------------------------------------
+
+def load_cache(filename):
+    """
+    Load the hashes of the files compressed last time (if any).
+    """
+    if (filename is None) or (not os.path.isfile(filename)):
+        return {}
+    with open(filename, 'r') as reader:
+        data = json.load(reader)
+    if data.get('version') != VERSION:
+        return {}
+    return data['files']
+
+def save_cache(filename, files):
+    """
+    Save the hashes of the files compressed this time (along with those
+    of files in other output directories).
+    """
+    if filename is None:
+        return
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename, 'w') as writer:
+        json.dump({'version' : VERSION, 'files' : files},
+                  writer, indent=1, sort_keys=True)
+
+def update_manifest(root_dir, results):
+    """
+    Add the compressed copies of files to the output directory's
+    manifest (if there is one), and remove compressed copies that no
+    longer exist.
+    """
+    filename = os.path.join(root_dir, OUTPUT_MANIFEST)
+    if not os.path.isfile(filename):
+        return
+    with open(filename, 'r') as reader:
+        manifest = json.load(reader)
+    for key in [k for k in manifest if is_compressed(k)]:
+        del manifest[key]
+    for (path, record, written) in results:
+        for (suffix, digest) in record['compressed'].items():
+            manifest[path + suffix] = digest
+    text = json.dumps(manifest, indent=1, sort_keys=True)
+    write_atomic(filename, text.encode('utf-8'))
+
+#-------------------------------------------------------------------------------
+
+def usage(exit_status):
+    """
+    Show usage and exit.
+    """
+    sys.stderr.write(USAGE)
+    sys.exit(exit_status)
+
+def main(args):
+    """
+    Main driver.
+    """
+    cache_dir, jobs = None, 1
+    options, args = getopt.getopt(args, 'b:hj:')
+    for opt, arg in options:
+        if opt == '-b':
+            cache_dir = arg
+        elif opt == '-h':
+            usage(0)
+        elif opt == '-j':
+            assert arg.isdigit() and int(arg) > 0, \
+                   'Number of jobs must be a positive integer'
+            jobs = int(arg)
+        else:
+            assert False, \
+                   'Unknown option %s' % opt
+    if len(args) != 1:
+        usage(1)
+    root_dir = args[0]
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, CACHE_FILE)
+    old = load_cache(cache_file)
+    prefix = os.path.join(os.path.abspath(root_dir), '')
+
+    sources, compressed = find_files(root_dir)
+    tasks = [(root_dir, path, old.get(prefix + path)) for path in sources]
+    if (jobs == 1) or (len(tasks) < 2):
+        results = [compress(t) for t in tasks]
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(compress, tasks, max(1, len(tasks) // (4 * jobs)))
+        finally:
+            pool.close()
+            pool.join()
+
+    # Remove compressed copies of files that have gone away.
+    present = set(sources)
+    for path in compressed:
+        if os.path.splitext(path)[0] not in present:
+            os.unlink(os.path.join(root_dir, path))
+
+    files = dict((key, record) for (key, record) in old.items()
+                 if not key.startswith(prefix))
+    files.update((prefix + path, record) for (path, record, written) in results)
+    save_cache(cache_file, files)
+    update_manifest(root_dir, results)
+    written = len([r for r in results if r[2]])
+    sys.stderr.write('precompressed %d of %d files\n' % (written, len(results)))
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+Publish the built site by copying only what has changed.
+
+compile.py (and precompress.py) leave a manifest in the output
+directory giving the SHA-1 hash of every file they wrote.  This
+compares it with the manifest of what was last published to the
+target directory, copies the files that have been added or changed,
+deletes the ones that have gone away, and then saves the new manifest
+in the target.  The time this takes depends on the size of the
+change, not the size of the site: nothing in the target is read or
+compared.  Files in the output directory that aren't in the manifest
+(e.g., .htaccess, which make copies) are hashed here.
+
+If the target has no manifest (e.g., it has never been published to
+with this program), everything is copied.
+"""
+
+import sys
+import os
+import getopt
+import hashlib
+import json
+import shutil
+import tempfile
+
+#-------------------------------------------------------------------------------
+
+USAGE = """publish.py [options] output_directory_path target_directory_path: publish site
+-h                                      show this help and exit
+-n                                      report what would change, but don't
+                                        change anything
+-v                                      list files added, changed, and removed
+"""
+
+MANIFEST = '.manifest.json'
+
+#-------------------------------------------------------------------------------
+
+def load_manifest(root_dir):
+    """
+    Load the manifest in a directory (or an empty one if there is none).
+    """
+    filename = os.path.join(root_dir, MANIFEST)
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename, 'r') as reader:
+        return json.load(reader)
+
+def build_manifest(root_dir):
+    """
+    Return the hashes of everything in the output directory, using its
+    manifest where possible and hashing any other files.  Temporary
+    files (which start with '.' and contain the name of the file they
+    will replace) and the manifest itself are ignored.
+    """
+    recorded = load_manifest(root_dir)
+    result = {}
+    for (dirpath, dirnames, filenames) in os.walk(root_dir):
+        for name in filenames:
+            path = os.path.relpath(os.path.join(dirpath, name), root_dir)
+            if (name == MANIFEST) or (name.startswith('.') and
+                                      (name != '.htaccess')):
+                continue
+            if path in recorded:
+                result[path] = recorded[path]
+            else:
+                result[path] = hash_file(os.path.join(root_dir, path))
+    return result
+
+def hash_file(path):
+    """
+    Return the SHA-1 hash of a file's contents.
+    """
+    with open(path, 'rb') as reader:
+        return hashlib.sha1(reader.read()).hexdigest()
+
+def compare(old, new):
+    """
+    Return the sorted paths of files added, changed, and removed.
+    """
+    added = sorted(set(new) - set(old))
+    changed = sorted(p for p in set(new) & set(old) if new[p] != old[p])
+    removed = sorted(set(old) - set(new))
+    return added, changed, removed
+
+#-------------------------------------------------------------------------------
+
+def copy_file(src, dst):
+    """
+    Copy a file into place through a temporary file, so that the
+    destination is never partly written.
+    """
+    directory = os.path.dirname(dst)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(dst))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, temp)
+        shutil.copymode(src, temp)
+        replace(temp, dst)
+    except:
+        os.unlink(temp)
+        raise
+
+def remove_file(root_dir, path):
+    """
+    Remove a file, and any directories above it that are left empty.
+    """
+    full = os.path.join(root_dir, path)
+    if os.path.isfile(full):
+        os.unlink(full)
+    directory = os.path.dirname(full)
+    while os.path.abspath(directory) != os.path.abspath(root_dir) and \
+          os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+def save_manifest(root_dir, manifest):
+    """
+    Record what has been published.  This is done last, so if
+    publishing is interrupted, the next run repeats the work.
+    """
+    fd, temp = tempfile.mkstemp(dir=root_dir, prefix=MANIFEST)
+    with os.fdopen(fd, 'w') as writer:
+        json.dump(manifest, writer, indent=1, sort_keys=True)
+    replace(temp, os.path.join(root_dir, MANIFEST))
+
+def replace(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        os.rename(src, dst)
+
+#-------------------------------------------------------------------------------
+
+def usage(exit_status):
+    """
+    Show usage and exit.
+    """
+    sys.stderr.write(USAGE)
+    sys.exit(exit_status)
+
+def main(args):
+    """
+    Main driver.
+    """
+    dry_run, verbose = False, False
+    options, args = getopt.getopt(args, 'hnv')
+    for opt, arg in options:
+        if opt == '-h':
+            usage(0)
+        elif opt == '-n':
+            dry_run = True
+        elif opt == '-v':
+            verbose = True
+        else:
+            assert False, \
+                   'Unknown option %s' % opt
+    if len(args) != 2:
+        usage(1)
+    source_dir, target_dir = args
+    assert os.path.isdir(source_dir), \
+           'Output directory "%s" not found' % source_dir
+
+    new = build_manifest(source_dir)
+    old = load_manifest(target_dir) if os.path.isdir(target_dir) else {}
+    added, changed, removed = compare(old, new)
+
+    if verbose or dry_run:
+        for (flag, paths) in (('A', added), ('M', changed), ('D', removed)):
+            for path in paths:
+                print('%s %s' % (flag, path))
+    sys.stderr.write('%d added, %d changed, %d removed, %d unchanged\n' %
+                     (len(added), len(changed), len(removed),
+                      len(new) - len(added) - len(changed)))
+    if dry_run:
+        return
+
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+    for path in added + changed:
+        copy_file(os.path.join(source_dir, path), os.path.join(target_dir, path))
+    for path in removed:
+        remove_file(target_dir, path)
+    save_manifest(target_dir, new)
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
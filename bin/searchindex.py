@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+Build an inverted index for searching the site in the browser.
+
+compile.py gives this module the title and content of every page
+that should be searchable (blog posts, lessons, and topics).  Terms
+are extracted at build time, and the index is written as a set of
+small JSON files so that js/search.js only has to fetch the few that
+a query needs:
+
+    index.json     manifest: number of documents, shard prefixes, etc.
+    docs-N.json    [url, title, date] of documents N*DOCS_PER_CHUNK
+                   up to (N+1)*DOCS_PER_CHUNK
+    terms-XX.json  {term : [doc, weight, doc, weight, ...]} for terms
+                   starting with XX
+
+Documents are numbered in order of date (undated pages first), so
+adding a new post doesn't renumber the others, and the terms of each
+document are remembered in the build cache directory so that only
+changed documents are re-tokenized.  Since the output files are only
+rewritten if they change, an incremental build only touches the
+shards holding the terms of the pages that changed.  An index that
+is written more than once (by compile.py's watch mode) only builds
+the shards whose postings have changed the second time around.
+"""
+
+import os
+import re
+import json
+
+#-------------------------------------------------------------------------------
+
+VERSION = 1
+
+MARKUP_PAT = re.compile(r'{%.*?%}|{{.*?}}|{#.*?#}|<[^>]*>|&#?[a-zA-Z0-9]+;', re.DOTALL)
+TERM_PAT = re.compile(r'[a-z0-9]+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+STOP_WORDS = set('''
+about an and are as at be but by can for from has have how if in into is
+it its not of on or so than that the their there these this to was we
+were what when which who will with you your
+'''.split())
+
+PREFIX_LENGTH = 2
+DOCS_PER_CHUNK = 100
+TITLE_WEIGHT = 10
+
+# Names of the shard and chunk files (see the module docstring).
+INDEX_FILE_PAT = re.compile(r'^(terms-[a-z0-9]+|docs-[0-9]+)\.json$')
+
+#-------------------------------------------------------------------------------
+
+def tokenize(text):
+    """
+    Return the searchable terms in some text (which may contain HTML
+    and Jinja2 markup), in order.  js/search.js must split queries the
+    same way.
+    """
+    text = MARKUP_PAT.sub(' ', text).lower()
+    return [t for t in TERM_PAT.findall(text)
+            if (MIN_TERM_LENGTH <= len(t) <= MAX_TERM_LENGTH) and
+               (t not in STOP_WORDS)]
+
+def weigh(title, text):
+    """
+    Return a dictionary mapping each term in a document to its weight
+    (the number of times it occurs, with words in the title counting
+    extra).
+    """
+    weights = {}
+    for term in tokenize(text):
+        weights[term] = weights.get(term, 0) + 1
+    for term in tokenize(title):
+        weights[term] = weights.get(term, 0) + TITLE_WEIGHT
+    return weights
+
+#-------------------------------------------------------------------------------
+
+class SearchIndex(object):
+    """
+    Collect documents and write the sharded index.  'filename' is where
+    each document's terms are kept between builds (or None).  After
+    the index is written, documents can be added again for another
+    build.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.old = {}
+        self.new = {}
+        self.changed = False
+        self.order = None
+        self.grouped = {}
+        self.dirty_docs = set()
+        self.dirty_prefixes = set()
+        if (filename is not None) and os.path.isfile(filename):
+            self._load()
+
+    def add(self, filename, url, title, date, signature, read):
+        """
+        Add a document.  'signature' must change whenever the document
+        does (e.g., its modification time and size); 'read' is only
+        called to get the document's text if it has.
+        """
+        signature = json.loads(json.dumps([url, title, date, signature]))
+        entry = self.old.get(filename)
+        if (entry is None) or (entry['signature'] != signature):
+            old_terms = {} if (entry is None) else entry['terms']
+            entry = {'signature' : signature,
+                     'url' : url,
+                     'title' : title,
+                     'date' : date,
+                     'terms' : weigh(title, read())}
+            self.changed = True
+            self.dirty_docs.add(filename)
+            self.grouped.pop(filename, None)
+            new_terms = entry['terms']
+            self.dirty_prefixes.update(t[:PREFIX_LENGTH]
+                                       for t in set(old_terms) | set(new_terms)
+                                       if old_terms.get(t) != new_terms.get(t))
+        self.new[filename] = entry
+
+    def write(self, writer, directory):
+        """
+        Write the index files to a directory using an OutputWriter
+        (which leaves unchanged files alone), then save the documents'
+        terms for the next build.  If this index has been written
+        before, only the shards whose postings have changed, and the
+        document chunks holding changed or renumbered documents, are
+        built and written.  Shard and chunk files left over from an
+        earlier index are removed (through the writer, so that they
+        leave its manifest as well).
+        """
+        docs = sorted(self.new.items(),
+                      key=lambda item: (item[1]['date'] or '', item[0]))
+        order = [filename for (filename, entry) in docs]
+
+        if self.order is None:
+            prefixes, shards = self._all_shards(docs)
+            dirty_docs = set(order)
+        else:
+            # Documents after the first one whose position has changed
+            # are renumbered, so all of their terms are affected, as
+            # are the terms of documents that have been removed.
+            start = 0
+            while (start < min(len(order), len(self.order))) and \
+                  (order[start] == self.order[start]):
+                start += 1
+            dirty_docs = self.dirty_docs | set(order[start:])
+            dirty = set(self.dirty_prefixes)
+            for (filename, entry) in docs[start:]:
+                dirty.update(self._group(filename, entry))
+            for filename in set(self.old) - set(self.new):
+                dirty.update(t[:PREFIX_LENGTH] for t in self.old[filename]['terms'])
+                self.grouped.pop(filename, None)
+            prefixes, shards = self._some_shards(docs, dirty)
+
+        chunks = []
+        dirty_chunks = set()
+        for (i, (filename, entry)) in enumerate(docs):
+            if (i % DOCS_PER_CHUNK) == 0:
+                chunks.append([])
+            chunks[-1].append([entry['url'], entry['title'], entry['date']])
+            if filename in dirty_docs:
+                dirty_chunks.add(len(chunks) - 1)
+
+        for (prefix, shard) in shards.items():
+            self._write(writer, directory, 'terms-%s.json' % prefix, shard)
+        for (i, chunk) in enumerate(chunks):
+            if i in dirty_chunks:
+                self._write(writer, directory, 'docs-%d.json' % i, chunk)
+        self._write(writer, directory, 'index.json',
+                    {'version' : VERSION,
+                     'documents' : len(docs),
+                     'chunk' : DOCS_PER_CHUNK,
+                     'prefix' : PREFIX_LENGTH,
+                     'min' : MIN_TERM_LENGTH,
+                     'max' : MAX_TERM_LENGTH,
+                     'stop' : sorted(STOP_WORDS),
+                     'shards' : sorted(prefixes)})
+        current = set('terms-%s.json' % p for p in prefixes) | \
+                  set('docs-%d.json' % i for i in range(len(chunks)))
+        for name in sorted(os.listdir(directory)):
+            if INDEX_FILE_PAT.match(name) and (name not in current):
+                writer.remove(os.path.join(directory, name))
+        self._save()
+        self.order = order
+        self.dirty_docs = set()
+        self.dirty_prefixes = set()
+        self.old, self.new, self.changed = self.new, {}, False
+
+    def _all_shards(self, docs):
+        """
+        Build every shard, returning the set of prefixes and a
+        dictionary mapping each prefix to its shard.
+        """
+        shards = {}
+        for (i, (filename, entry)) in enumerate(docs):
+            for (term, weight) in entry['terms'].items():
+                shard = shards.setdefault(term[:PREFIX_LENGTH], {})
+                shard.setdefault(term, []).extend([i, weight])
+        return set(shards), shards
+
+    def _some_shards(self, docs, dirty):
+        """
+        Build the shards for the 'dirty' prefixes only (using each
+        document's terms grouped by prefix), returning the set of all
+        prefixes and a dictionary of the shards built.  Prefixes that
+        no longer have any terms are left out.
+        """
+        prefixes = set()
+        shards = {}
+        for (i, (filename, entry)) in enumerate(docs):
+            grouped = self._group(filename, entry)
+            prefixes.update(grouped)
+            for prefix in dirty.intersection(grouped):
+                shard = shards.setdefault(prefix, {})
+                for (term, weight) in grouped[prefix]:
+                    shard.setdefault(term, []).extend([i, weight])
+        return prefixes, shards
+
+    def _group(self, filename, entry):
+        """
+        Return a document's (term, weight) pairs grouped by prefix,
+        remembering the grouping until the document changes.
+        """
+        if filename not in self.grouped:
+            grouped = {}
+            for (term, weight) in entry['terms'].items():
+                grouped.setdefault(term[:PREFIX_LENGTH], []).append((term, weight))
+            self.grouped[filename] = grouped
+        return self.grouped[filename]
+
+    def _write(self, writer, directory, name, data):
+        """
+        Write one file of the index as compact (and deterministic) JSON.
+        """
+        text = json.dumps(data, separators=(',', ':'), sort_keys=True)
+        writer.write(os.path.join(directory, name), text)
+
+    def _load(self):
+        """
+        Load the terms saved by the previous build.
+        """
+        with open(self.filename, 'r') as reader:
+            data = json.load(reader)
+        if data.get('version') == VERSION:
+            self.old = data['docs']
+
+    def _save(self):
+        """
+        Save the terms of this build's documents (if any have changed).
+        """
+        if self.filename is None:
+            return
+        if (not self.changed) and (set(self.new) == set(self.old)):
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        text = json.dumps({'version' : VERSION, 'docs' : self.new},
+                          separators=(',', ':'), sort_keys=True)
+        with open(self.filename, 'w') as writer:
+            writer.write(text)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+Check that external (http and https) URLs work, many at a time.
+
+URLChecker uses asyncio (so it needs Python 3.7 or later) and speaks
+just enough HTTP/1.1 itself that nothing has to be installed.  Each
+URL is tried with a HEAD request, then with GET if the server won't
+answer HEAD properly (some reply 405 or 501, and some misconfigured
+ones 403 or 404), and redirects are followed.  Connections are kept
+alive and reused for each host; no more than PER_HOST requests go to
+one host at a time, their starts are spaced HOST_INTERVAL seconds
+apart so that no site is hammered, and no more than MAX_REQUESTS are
+in flight overall.
+
+Results are kept in a JSON file (in the build cache directory) with
+the time they were found.  URLs that worked aren't checked again until
+their results are TTL seconds old; broken ones are checked every time,
+since the problem may have been temporary.
+
+Run as a script, it checks the URLs on standard input (one per line)
+and prints the ones that don't work.
+"""
+
+import sys
+import os
+import time
+import json
+import ssl
+import asyncio
+from urllib.parse import urlsplit, urljoin, quote
+
+#-------------------------------------------------------------------------------
+
+MAX_REQUESTS = 32
+PER_HOST = 4
+HOST_INTERVAL = 0.1
+TIMEOUT = 15
+MAX_REDIRECTS = 5
+MAX_BODY = 1024 * 1024
+TTL = 7 * 24 * 60 * 60
+
+CACHE_FILE = 'urls.json'
+VERSION = 1
+
+USER_AGENT = 'Software Carpentry link checker'
+REDIRECTS = (301, 302, 303, 307, 308)
+RETRY_WITH_GET = (403, 404, 405, 501)
+NO_BODY = (204, 304)
+
+# Request path characters that are sent as they are.
+PATH_SAFE = "/%?=&;:@!$'()*+,~-._"
+
+#-------------------------------------------------------------------------------
+
+class Host(object):
+    """
+    Idle connections and limits for one scheme, host, and port.
+    """
+
+    def __init__(self):
+        self.idle = []
+        self.limit = asyncio.Semaphore(PER_HOST)
+        self.next_start = 0
+
+
+class URLChecker(object):
+    """
+    Check URLs, remembering the results in 'filename' (if given).
+    A result is a dictionary with the final HTTP 'status' (or None)
+    and an 'error' message (or None), and the time it was 'checked'.
+    """
+
+    def __init__(self, filename=None, ttl=TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self.results = {}
+        self.hosts = None
+        self.requests = None
+        self.ssl = None
+        self._load()
+
+    def check(self, urls):
+        """
+        Check URLs (except those whose results are still fresh),
+        returning a dictionary of their results.  Results for URLs not
+        asked about are forgotten.
+        """
+        urls = sorted(set(urls))
+        now = time.time()
+        todo = [u for u in urls if not self._fresh(u, now)]
+        if todo:
+            asyncio.run(self._check_all(todo))
+        self.results = dict((u, self.results[u]) for u in urls)
+        return dict(self.results)
+
+    def save(self):
+        """
+        Save the results for the next run.
+        """
+        if self.filename is None:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.filename, 'w') as writer:
+            writer.write(json.dumps({'version' : VERSION, 'urls' : self.results},
+                                    sort_keys=True))
+
+    def _fresh(self, url, now):
+        """
+        Can a URL's saved result be used instead of checking it again?
+        """
+        result = self.results.get(url)
+        return (result is not None) and is_ok(result) and \
+               (now - result['checked'] < self.ttl)
+
+    def _load(self):
+        """
+        Load the results saved by the last run (if any).
+        """
+        if (self.filename is None) or (not os.path.isfile(self.filename)):
+            return
+        with open(self.filename, 'r') as reader:
+            data = json.load(reader)
+        if data.get('version') == VERSION:
+            self.results = data['urls']
+
+    #---------------------------------------------------------------------------
+
+    async def _check_all(self, urls):
+        """
+        Check URLs concurrently, then close the connections left open.
+        """
+        self.hosts = {}
+        self.requests = asyncio.Semaphore(MAX_REQUESTS)
+        self.ssl = ssl.create_default_context()
+        try:
+            await asyncio.gather(*[self._check(u) for u in urls])
+        finally:
+            for host in self.hosts.values():
+                for (reader, writer) in host.idle:
+                    writer.close()
+
+    async def _check(self, url):
+        """
+        Check one URL and record the result.
+        """
+        result = {'status' : None, 'error' : None}
+        try:
+            result['status'] = await self._follow(url)
+        except asyncio.TimeoutError:
+            result['error'] = 'timed out'
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            result['error'] = str(e) or e.__class__.__name__
+        result['checked'] = time.time()
+        self.results[url] = result
+
+    async def _follow(self, url):
+        """
+        Request a URL, following redirects, and return the final status.
+        """
+        for i in range(MAX_REDIRECTS + 1):
+            status, location = await self._request('HEAD', url)
+            if status in RETRY_WITH_GET:
+                status, location = await self._request('GET', url)
+            if (status not in REDIRECTS) or (not location):
+                return status
+            url = urljoin(url, location)
+        raise ValueError('too many redirects')
+
+    async def _request(self, method, url):
+        """
+        Make one request, returning the status and the Location header
+        (if any).  An idle connection to the host is used if there is
+        one (and a new one is made if the server has closed it).
+        """
+        parts = urlsplit(url.split('#')[0])
+        if (parts.scheme not in ('http', 'https')) or (not parts.hostname):
+            raise ValueError('cannot check %s' % url)
+        port = parts.port or (443 if (parts.scheme == 'https') else 80)
+        key = (parts.scheme, parts.hostname, port)
+        host = self.hosts.setdefault(key, Host())
+        path = quote(parts.path or '/', safe=PATH_SAFE)
+        if parts.query:
+            path += '?' + quote(parts.query, safe=PATH_SAFE)
+        request = ('%s %s HTTP/1.1\r\n'
+                   'Host: %s\r\n'
+                   'User-Agent: %s\r\n'
+                   'Accept: */*\r\n'
+                   '\r\n') % (method, path, parts.netloc.rpartition('@')[2],
+                              USER_AGENT)
+
+        async with host.limit:
+            async with self.requests:
+                await self._space(host)
+                while True:
+                    reused = bool(host.idle)
+                    if reused:
+                        connection = host.idle.pop()
+                    else:
+                        connection = await asyncio.wait_for(
+                            asyncio.open_connection(
+                                parts.hostname, port,
+                                ssl=self.ssl if (parts.scheme == 'https') else None),
+                            TIMEOUT)
+                    try:
+                        status, headers, keep = await asyncio.wait_for(
+                            exchange(connection, method, request), TIMEOUT)
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        # Servers close idle connections when they like.
+                        connection[1].close()
+                        if reused:
+                            continue
+                        raise
+                    except BaseException:
+                        connection[1].close()
+                        raise
+                    break
+                if keep:
+                    host.idle.append(connection)
+                else:
+                    connection[1].close()
+        return status, headers.get('location')
+
+    async def _space(self, host):
+        """
+        Wait until the next request to a host may start.
+        """
+        now = asyncio.get_running_loop().time()
+        start = max(now, host.next_start)
+        host.next_start = start + HOST_INTERVAL
+        if start > now:
+            await asyncio.sleep(start - now)
+
+#-------------------------------------------------------------------------------
+
+async def exchange(connection, method, request):
+    """
+    Send a request and read the response's status and headers, and its
+    body if that is needed to reuse the connection.  Returns the
+    status, the headers (with lower-case names), and whether the
+    connection can be used again.
+    """
+    reader, writer = connection
+    writer.write(request.encode('latin-1'))
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('connection closed')
+    fields = line.decode('latin-1').split(None, 2)
+    if (len(fields) < 2) or (not fields[0].startswith('HTTP/')) or \
+       (not fields[1].isdigit()):
+        raise ValueError('bad response %r' % line)
+    version, status = fields[0], int(fields[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    keep = (version == 'HTTP/1.1') and (headers.get('connection', '').lower() != 'close')
+    if (method == 'HEAD') or (status in NO_BODY) or (100 <= status < 200):
+        pass
+    elif headers.get('content-length', '').isdigit() and \
+         (int(headers['content-length']) <= MAX_BODY):
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        # Chunked or very large bodies aren't worth reading: give up
+        # on the connection instead.
+        keep = False
+    return status, headers, keep
+
+def is_ok(result):
+    """
+    Did a URL work?
+    """
+    return (result['status'] is not None) and (result['status'] < 400)
+
+def describe(result):
+    """
+    Say briefly what went wrong with a URL.
+    """
+    if result['error'] is not None:
+        return result['error']
+    return 'HTTP %d' % result['status']
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    checker = URLChecker()
+    urls = [line.strip() for line in sys.stdin if line.strip()]
+    for (url, result) in sorted(checker.check(urls).items()):
+        if not is_ok(result):
+            print('{0} ({1})'.format(url, describe(result)))
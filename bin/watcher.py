@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+"""
+Watch directory trees for changes to the files in them.
+
+Watcher uses Linux's inotify (through ctypes, so nothing has to be
+installed) where it is available, and otherwise polls the trees,
+comparing each file's modification time and size with what they were
+last time.  wait() blocks until something changes, then keeps
+collecting changes until there has been a short quiet period (so that
+an editor writing a file and renaming it into place, or a 'git
+checkout' touching dozens of files, causes one rebuild rather than
+many), and returns the paths of the files that were created, changed,
+or deleted.  Files and directories whose names start with '.'
+(temporary files, version control directories, and the like) are
+ignored, as are the files and directories listed in 'ignore' (such as
+the directory the site is being built in).
+
+Run as a script, it prints changes to the given directories until
+interrupted.
+"""
+
+import sys
+import os
+import time
+import errno
+import select
+import struct
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+#-------------------------------------------------------------------------------
+
+SETTLE_TIME = 0.05
+POLL_INTERVAL = 0.25
+
+# Flags from <sys/inotify.h>.
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+             IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+#-------------------------------------------------------------------------------
+
+class Watcher(object):
+    """
+    Report changes to files under a set of directories.  'method' is
+    'inotify' or 'poll' once the watcher has been created.
+    """
+
+    def __init__(self, directories, ignore=()):
+        roots = sorted(set(os.path.normpath(d) for d in directories))
+        self.roots = [d for d in roots
+                      if not any(inside(d, other) for other in roots if other != d)]
+        self.ignore = set(os.path.abspath(p) for p in ignore if p)
+        self.fd = None
+        self.libc = None
+        self.wds = {}
+        self.snapshot = None
+        self._start_inotify()
+        if self.fd is None:
+            self.method = 'poll'
+            self.snapshot = self._scan()
+        else:
+            self.method = 'inotify'
+
+    def wait(self):
+        """
+        Wait for files to change, returning their sorted paths.
+        """
+        changed = set()
+        while not changed:
+            changed = self._collect(None)
+        while True:
+            more = self._collect(SETTLE_TIME)
+            if not more:
+                break
+            changed.update(more)
+        return sorted(changed)
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _collect(self, timeout):
+        """
+        Return the set of paths that change within 'timeout' seconds
+        (or whenever something next changes, if it is None).
+        """
+        if self.fd is None:
+            return self._poll(timeout)
+        return self._read_events(timeout)
+
+    def _walk(self):
+        """
+        Yield (directory, filenames) for every directory being watched,
+        skipping hidden and ignored files and directories.
+        """
+        for root in self.roots:
+            for (dirpath, dirnames, filenames) in os.walk(root):
+                dirnames[:] = [d for d in dirnames
+                               if not self._skip(os.path.join(dirpath, d))]
+                yield (dirpath, [f for f in filenames
+                                 if not self._skip(os.path.join(dirpath, f))])
+
+    def _skip(self, path):
+        """
+        Should changes to this file or directory be ignored?
+        """
+        return os.path.basename(path).startswith('.') or \
+               (os.path.abspath(path) in self.ignore)
+
+    #---------------------------------------------------------------------------
+
+    def _poll(self, timeout):
+        """
+        Compare the files on disk with the last snapshot.
+        """
+        time.sleep(POLL_INTERVAL if (timeout is None) else timeout)
+        current = self._scan()
+        changed = set(path for (path, stamp) in current.items()
+                      if self.snapshot.get(path) != stamp)
+        changed.update(set(self.snapshot) - set(current))
+        self.snapshot = current
+        return changed
+
+    def _scan(self):
+        """
+        Return a dictionary mapping each file's path to its
+        modification time and size.
+        """
+        result = {}
+        for (dirpath, filenames) in self._walk():
+            for name in filenames:
+                path = os.path.normpath(os.path.join(dirpath, name))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result[path] = (st.st_mtime, st.st_size)
+        return result
+
+    #---------------------------------------------------------------------------
+
+    def _start_inotify(self):
+        """
+        Set up inotify watches on every directory, leaving self.fd as
+        None if inotify isn't available (or runs out of watches).
+        """
+        if (ctypes is None) or (not sys.platform.startswith('linux')):
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            libc.inotify_init.argtypes = []
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                               ctypes.c_uint32]
+        except (OSError, AttributeError):
+            return
+        fd = libc.inotify_init()
+        if fd < 0:
+            return
+        self.fd, self.libc = fd, libc
+        for (dirpath, filenames) in self._walk():
+            if not self._add_watch(dirpath):
+                self.close()
+                return
+
+    def _add_watch(self, directory):
+        """
+        Watch one directory, returning False if that isn't possible.
+        A directory that has already disappeared doesn't count.
+        """
+        path = directory
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, path, WATCH_MASK)
+        if wd < 0:
+            return ctypes.get_errno() in (errno.ENOENT, errno.ENOTDIR)
+        self.wds[wd] = os.path.normpath(directory)
+        return True
+
+    def _read_events(self, timeout):
+        """
+        Read pending inotify events, returning the paths of the files
+        they are about.  New directories are watched (and the files
+        already in them reported); if the kernel's queue overflowed,
+        every file is reported.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, READ_SIZE)
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self._all_files())
+                continue
+            if mask & IN_IGNORED:
+                self.wds.pop(wd, None)
+                continue
+            if (wd not in self.wds) or (not name):
+                continue
+            if not isinstance(name, str):
+                name = name.decode(sys.getfilesystemencoding())
+            path = os.path.join(self.wds[wd], name)
+            if self._skip(path):
+                continue
+            if (mask & IN_ISDIR) and (mask & (IN_CREATE | IN_MOVED_TO)):
+                changed.update(self._watch_new(path))
+            changed.add(os.path.normpath(path))
+        return changed
+
+    def _watch_new(self, directory):
+        """
+        Watch a directory that has just appeared (and everything under
+        it), returning the files already in it.
+        """
+        result = set()
+        for (dirpath, dirnames, filenames) in os.walk(directory):
+            dirnames[:] = [d for d in dirnames
+                           if not self._skip(os.path.join(dirpath, d))]
+            self._add_watch(dirpath)
+            result.update(os.path.normpath(os.path.join(dirpath, f))
+                          for f in filenames
+                          if not self._skip(os.path.join(dirpath, f)))
+        return result
+
+    def _all_files(self):
+        """
+        Return the paths of all the files being watched.
+        """
+        return set(os.path.normpath(os.path.join(dirpath, f))
+                   for (dirpath, filenames) in self._walk()
+                   for f in filenames)
+
+#-------------------------------------------------------------------------------
+
+def inside(path, directory):
+    """
+    Is 'path' somewhere under 'directory'?
+    """
+    path, directory = os.path.abspath(path), os.path.abspath(directory)
+    return path.startswith(directory.rstrip(os.sep) + os.sep)
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    watcher = Watcher(sys.argv[1:] or ['.'])
+    sys.stderr.write('watching with %s\n' % watcher.method)
+    try:
+        while True:
+            for path in watcher.wait():
+                print(path)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,179 @@
+/*
+ * Search the site using the index built by compile.py (see
+ * bin/searchindex.py).  Only the manifest, the shards holding the
+ * query's terms, and the descriptions of the top results are fetched,
+ * so a query costs a few small requests and no server work.
+ *
+ * Usage: swcSearch(root, index, query, element) fills 'element' with
+ * links to the pages matching every word in 'query', best first.
+ * 'root' is the relative path from the current page to the site root,
+ * and 'index' is the path of the index's directory from the site root.
+ */
+
+var swcSearch = (function () {
+
+  var MAX_RESULTS = 50;
+  var cache = {};
+
+  // Fetch and parse a JSON file (once), calling back with null if it
+  // can't be loaded.
+  function load(url, callback) {
+    if (cache.hasOwnProperty(url)) {
+      callback(cache[url]);
+      return;
+    }
+    var request = new XMLHttpRequest();
+    request.onreadystatechange = function () {
+      if (request.readyState !== 4) {
+        return;
+      }
+      var data = null;
+      if ((request.status === 200) || (request.status === 0 && request.responseText)) {
+        data = JSON.parse(request.responseText);
+      }
+      cache[url] = data;
+      callback(data);
+    };
+    request.open('GET', url, true);
+    request.send(null);
+  }
+
+  // Load several files, calling back with a map from name to contents
+  // once all have arrived.
+  function loadAll(base, names, callback) {
+    var result = {}, remaining = names.length;
+    if (remaining === 0) {
+      callback(result);
+      return;
+    }
+    names.forEach(function (name) {
+      load(base + name, function (data) {
+        result[name] = data;
+        remaining -= 1;
+        if (remaining === 0) {
+          callback(result);
+        }
+      });
+    });
+  }
+
+  // Split a query into terms the same way searchindex.tokenize does.
+  function tokenize(manifest, query) {
+    var words = query.toLowerCase().match(/[a-z0-9]+/g) || [];
+    var seen = {}, terms = [];
+    words.forEach(function (word) {
+      if ((word.length >= manifest.min) && (word.length <= manifest.max) &&
+          (manifest.stop.indexOf(word) < 0) && !seen[word]) {
+        seen[word] = true;
+        terms.push(word);
+      }
+    });
+    return terms;
+  }
+
+  // Score documents containing every term (weight times inverse
+  // document frequency), returning [doc, score] pairs, best first.
+  function rank(manifest, terms, shards) {
+    var scores = null;
+    terms.forEach(function (term) {
+      var shard = shards['terms-' + term.substring(0, manifest.prefix) + '.json'];
+      var postings = (shard && shard[term]) || [];
+      var idf = Math.log(1 + manifest.documents / Math.max(1, postings.length / 2));
+      var next = {};
+      for (var i = 0; i < postings.length; i += 2) {
+        var doc = postings[i];
+        if ((scores === null) || scores.hasOwnProperty(doc)) {
+          next[doc] = (scores === null ? 0 : scores[doc]) + postings[i + 1] * idf;
+        }
+      }
+      scores = next;
+    });
+    var result = [];
+    for (var doc in scores) {
+      result.push([parseInt(doc, 10), scores[doc]]);
+    }
+    result.sort(function (a, b) { return (b[1] - a[1]) || (a[0] - b[0]); });
+    return result;
+  }
+
+  // Show the results, skipping any whose descriptions couldn't be
+  // loaded (or saying the index isn't available if none could).
+  function show(element, root, results, chunks, manifest, total) {
+    var found = [];
+    results.forEach(function (result) {
+      var doc = result[0];
+      var chunk = chunks['docs-' + Math.floor(doc / manifest.chunk) + '.json'];
+      if (chunk && chunk[doc % manifest.chunk]) {
+        found.push(chunk[doc % manifest.chunk]);
+      }
+    });
+    if ((results.length > 0) && (found.length === 0)) {
+      element.innerHTML = '<p>The search index is not available.</p>';
+      return;
+    }
+    element.innerHTML = '';
+    var summary = document.createElement('p');
+    summary.appendChild(document.createTextNode(
+      total === 0 ? 'No pages found.' :
+      total === 1 ? '1 page found.' :
+      total > results.length ? total + ' pages found (showing the best ' + results.length + ').' :
+      total + ' pages found.'));
+    element.appendChild(summary);
+    if (results.length === 0) {
+      return;
+    }
+    var list = document.createElement('ol');
+    found.forEach(function (info) {
+      var item = document.createElement('li');
+      var link = document.createElement('a');
+      link.href = root + '/' + info[0];
+      link.appendChild(document.createTextNode(info[1] || info[0]));
+      item.appendChild(link);
+      if (info[2]) {
+        item.appendChild(document.createTextNode(' (' + info[2] + ')'));
+      }
+      list.appendChild(item);
+    });
+    element.appendChild(list);
+  }
+
+  return function (root, index, query, element) {
+    var base = root + '/' + index + '/';
+    load(base + 'index.json', function (manifest) {
+      if (manifest === null) {
+        element.innerHTML = '<p>The search index is not available.</p>';
+        return;
+      }
+      var terms = tokenize(manifest, query);
+      if (terms.length === 0) {
+        show(element, root, [], {}, manifest, 0);
+        return;
+      }
+      var wanted = [];
+      for (var i = 0; i < terms.length; i++) {
+        var prefix = terms[i].substring(0, manifest.prefix);
+        if (manifest.shards.indexOf(prefix) < 0) {
+          show(element, root, [], {}, manifest, 0);
+          return;
+        }
+        if (wanted.indexOf('terms-' + prefix + '.json') < 0) {
+          wanted.push('terms-' + prefix + '.json');
+        }
+      }
+      loadAll(base, wanted, function (shards) {
+        var ranked = rank(manifest, terms, shards);
+        var best = ranked.slice(0, MAX_RESULTS);
+        var chunks = [];
+        best.forEach(function (result) {
+          var name = 'docs-' + Math.floor(result[0] / manifest.chunk) + '.json';
+          if (chunks.indexOf(name) < 0) {
+            chunks.push(name);
+          }
+        });
+        loadAll(base, chunks, function (loaded) {
+          show(element, root, best, loaded, manifest, ranked.length);
+        });
+      });
+    });
+  };
+}());